@@ -2,6 +2,8 @@ import sys
 import loguru
 from pathlib import Path
 
+from src.utils.pillow_utils import PillowUtils
+
 
 # 配置日志记录器(保存一份到本地log.log)
 loguru.logger.add(
@@ -11,10 +13,16 @@ loguru.logger.add(
     level="DEBUG",
 )
 
+# 记录当前使用的 Pillow 构建(官方 Pillow 或 Pillow-SIMD)
+PillowUtils.log_build_info()
+
 
 # TODO: 图片水印
 # TODO: 图片上色
 if __name__ == "__main__":
+    # 只在主进程中检查一次，工作进程 (Windows/macOS 上以 spawn 方式启动) 不会重复警告
+    PillowUtils.warn_if_no_libjpeg_turbo()
+
     try:
         if len(sys.argv) > 1:
             from img_tools_cli import app
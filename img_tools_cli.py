@@ -537,6 +537,11 @@ if __name__ == "__main__":
 
     Image.MAX_IMAGE_PIXELS = None
 
+    from src.utils.pillow_utils import PillowUtils
+
+    # 只在主进程中检查一次，工作进程 (Windows/macOS 上以 spawn 方式启动) 不会重复警告
+    PillowUtils.warn_if_no_libjpeg_turbo()
+
     try:
         # 如果有传入选项那么直接执行命令行操作
         if len(sys.argv) > 1:
@@ -166,7 +166,7 @@ class InteractionTUI:
     @staticmethod
     def get_int_input(prompt_text: str, default=None, min_value=None, max_value=None):
         """获取整数输入"""
-        from src.utils.io_uitls import IOuitls
+        from src.utils.io_uitls import get_optimal_process_count
 
         default_prompt = f"[默认: {default}]" if default is not None else ""
 
@@ -192,7 +192,7 @@ class InteractionTUI:
                 continue
 
             if "线程" in prompt_text:
-                value = IOuitls.get_optimal_process_count() if value is None else value
+                value = get_optimal_process_count() if value is None else value
             return value
 
     @staticmethod
@@ -759,6 +759,11 @@ if __name__ == "__main__":
 
     Image.MAX_IMAGE_PIXELS = None
 
+    from src.utils.pillow_utils import PillowUtils
+
+    # 只在主进程中检查一次，工作进程 (Windows/macOS 上以 spawn 方式启动) 不会重复警告
+    PillowUtils.warn_if_no_libjpeg_turbo()
+
     try:
         InteractionTUI.interactive_cli()
     except KeyboardInterrupt:
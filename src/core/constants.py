@@ -31,6 +31,25 @@ COMMON_IMAGE_SUFFIXES: Final[tuple[str, ...]] = (
     ".webp",
 )
 
+# 递归查找图片时跳过的目录名 (版本控制、缓存、回收站等不会存放待处理图片的目录)
+DEFAULT_EXCLUDE_DIRS: Final[frozenset[str]] = frozenset(
+    {
+        ".git",
+        "__pycache__",
+        ".venv",
+        "node_modules",
+        ".thumbnails",
+        "$RECYCLE.BIN",
+    }
+)
+
+# 保存 JPEG 时使用的参数：
+# optimize 按实际符号频率重新生成 Huffman 表，不改变画质 (质量仍为 Pillow 默认的 75)，
+# 只会让文件更小
+JPEG_SAVE_KWARGS: Final[dict[str, bool]] = {
+    "optimize": True,
+}
+
 ARGS_EXPLAIN: Final[dict[str, str]] = {
     "img_dir_path": "图片目录路径(目录)",
     "img_path": "图片文件路径(单个文件)",
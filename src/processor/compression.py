@@ -1,4 +1,4 @@
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
 from typing import Any, Dict, Optional, Tuple
 
@@ -7,7 +7,12 @@ from tqdm import tqdm
 
 from src.core.enums import CompressionMode
 from src.processor import BaseProcessor
-from src.utils.io_uitls import IOuitls
+from src.utils.io_uitls import (
+    get_img_paths_by_dir,
+    get_optimal_process_count,
+    imap_paths,
+    detect_new_files,
+)
 
 
 class Compression(BaseProcessor):
@@ -35,13 +40,13 @@ class Compression(BaseProcessor):
             处理后的图片所在目录路径
         """
         img_dir_path = Path(img_dir_path)
-        thread_num = thread_num if thread_num else IOuitls.get_optimal_process_count()
+        thread_num = thread_num if thread_num else get_optimal_process_count()
 
         if not img_dir_path.exists() or not img_dir_path.is_dir():
             raise ValueError(f"图片目录 '{img_dir_path}' 不存在或不是一个目录。")
 
         # 获取目录下所有图片文件路径
-        img_paths = IOuitls.get_img_paths_by_dir(img_dir_path, recursion, suffix)
+        img_paths = get_img_paths_by_dir(img_dir_path, recursion, suffix)
 
         # 确定输出目录
         output_dir = (
@@ -59,34 +64,29 @@ class Compression(BaseProcessor):
             output_dir.mkdir(parents=True, exist_ok=True)
 
             # 记录一下原图片路径
-            detect_new_file_generator = IOuitls.detect_new_files(img_dir_path)
+            detect_new_file_generator = detect_new_files(img_dir_path)
             next(detect_new_file_generator)  # 第一次迭代，记录初始文件集
 
-        with ProcessPoolExecutor(max_workers=thread_num) as executor:
-            # 提交所有任务到进程池，传递输出目录参数
-            futures = [
-                executor.submit(
-                    Compression._process_wrapper,
-                    img_path,
-                    compression,
-                    override,
-                    output_dir
-                    if not override
-                    else None,  # 只在非覆盖模式下传递输出目录
-                )
-                for img_path in img_paths
-            ]
-
-            # 使用tqdm创建进度条
-            results = []
-            for future in tqdm(
-                as_completed(futures), total=len(futures), desc="压缩图片", unit="张"
-            ):
-                result = future.result()
-                # 如果结果是错误消息，则打印出来
-                if isinstance(result, str) and result.startswith("Error"):
-                    print(result)
-                results.append(result)
+        worker = partial(
+            Compression._process_wrapper,
+            compression=compression,
+            override=override,
+            # 只在非覆盖模式下传递输出目录
+            output_dir=output_dir if not override else None,
+        )
+
+        # 使用tqdm创建进度条，结果按完成顺序返回
+        results = []
+        for result in tqdm(
+            imap_paths(worker, img_paths, thread_num),
+            total=len(img_paths),
+            desc="压缩图片",
+            unit="张",
+        ):
+            # 如果结果是错误消息，则打印出来
+            if isinstance(result, str) and result.startswith("Error"):
+                print(result)
+            results.append(result)
 
         return output_dir
 
@@ -107,7 +107,8 @@ class Compression(BaseProcessor):
         """
         img_path = Path(img_path)
 
-        if not img_path.exists() or not img_path.is_file():
+        # is_file() 对不存在的路径同样返回 False，只需一次 stat
+        if not img_path.is_file():
             raise FileNotFoundError(f"图片未找到: {img_path}")
 
         try:
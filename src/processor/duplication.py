@@ -1,15 +1,35 @@
+import os
 import shutil
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import TYPE_CHECKING, Dict, Final, List, Optional, Set
 
-from imagededup.methods import CNN as CNNHasher
-from imagededup.methods import AHash, PHash, WHash
+import loguru
+import numpy as np
+from PIL import Image
 
 from src.core.enums import DuplicationMode, SaveFileMode
 from src.processor import BaseProcessor
+from src.utils.io_uitls import copy_with_times, link_or_copy
 
-# 使用Python 3.10的语法糖
-HASHER_TYPE = AHash | PHash | WHash | CNNHasher
+if TYPE_CHECKING:
+    # imagededup.methods 在导入时会加载 torch，只在需要哈希器时才真正导入
+    from imagededup.methods import CNN as CNNHasher
+    from imagededup.methods import AHash, PHash, WHash
+
+    # 使用Python 3.10的语法糖
+    HASHER_TYPE = AHash | PHash | WHash | CNNHasher
+
+# 使用 NumPy 批量计算哈希的模式及其缩放尺寸 (与 imagededup 保持一致)
+_FAST_HASH_TARGET_SIZE: Final[dict[DuplicationMode, tuple[int, int]]] = {
+    DuplicationMode.Fastest: (8, 8),  # AHash
+    DuplicationMode.Best: (32, 32),  # PHash
+}
+
+# imagededup 允许参与编码的图片格式
+_HASHABLE_FORMATS: Final[frozenset[str]] = frozenset(
+    ("JPEG", "PNG", "BMP", "MPO", "PPM", "TIFF", "GIF", "WEBP")
+)
 
 
 class Duplication(BaseProcessor):
@@ -20,6 +40,7 @@ class Duplication(BaseProcessor):
         save_file_mode: SaveFileMode = SaveFileMode.SaveFirst,
         thread_num: Optional[int] = None,
         override: bool = True,
+        hardlink: bool = False,
     ) -> Path:
         """批量处理图片去重
 
@@ -29,6 +50,7 @@ class Duplication(BaseProcessor):
             save_file_mode: 决定保留哪些重复图片的规则，默认为 SaveFirst
             thread_num: 处理器数量 (进程池大小)
             override: 是否直接在原图目录中删除重复图片，默认为 True
+            hardlink: 不覆盖时是否以硬链接代替复制保留的图片，默认为 False
 
         Returns:
             处理后图片所在的目录路径列表
@@ -37,7 +59,9 @@ class Duplication(BaseProcessor):
         if not img_dir_path.exists() or not img_dir_path.is_dir():
             raise ValueError(f"提供的路径 '{img_dir_path}' 不是一个有效的目录。")
 
-        return self.process(img_dir_path, duplication_mode, save_file_mode, override)
+        return self.process(
+            img_dir_path, duplication_mode, save_file_mode, override, hardlink
+        )
 
     def process(
         self,
@@ -45,6 +69,7 @@ class Duplication(BaseProcessor):
         duplication_mode: DuplicationMode = DuplicationMode.Normal,
         save_file_mode: SaveFileMode = SaveFileMode.SaveFirst,
         override: bool = True,
+        hardlink: bool = False,
     ) -> Path:
         """图片去重处理
 
@@ -58,6 +83,10 @@ class Duplication(BaseProcessor):
                              True: 直接删除，修改原目录。
                              False: 不修改原目录，而是创建一个新的目录 (例如 img_dir_deduplicated)
                                     存放去重后的图片。默认为 True。
+            hardlink (bool): 不覆盖时是否以硬链接代替复制保留的图片。
+                             硬链接与原图是同一个文件，原地修改输出目录中的图片
+                             会同时修改原图，因此默认为 False，此时使用 reflink
+                             (写时复制) 或完整复制，原目录不会受到影响。
 
         Returns:
             Path: 处理后图片所在的目录路径。
@@ -73,8 +102,11 @@ class Duplication(BaseProcessor):
 
         hasher = self._get_hasher(duplication_mode)
 
-        # 编码图片
-        encodings = hasher.encode_images(image_dir=str(img_dir))
+        # 编码图片 (AHash/PHash 使用 NumPy 批量计算，其余模式交给 imagededup)
+        if duplication_mode in _FAST_HASH_TARGET_SIZE:
+            encodings = self._encode_images_fast(img_dir, duplication_mode)
+        else:
+            encodings = hasher.encode_images(image_dir=str(img_dir))
 
         if not encodings:
             # 如果没有图片或无法编码图片
@@ -107,11 +139,11 @@ class Duplication(BaseProcessor):
         if override:
             # 直接删除原目录中的重复文件
             for file_to_delete in files_to_remove_set:
-                if file_to_delete.exists():
-                    try:
-                        file_to_delete.unlink()
-                    except OSError as e:
-                        raise OSError(f"删除文件 {file_to_delete.name} 失败: {e}")
+                try:
+                    # missing_ok 省去一次额外的 exists() stat 调用
+                    file_to_delete.unlink(missing_ok=True)
+                except OSError as e:
+                    raise OSError(f"删除文件 {file_to_delete.name} 失败: {e}")
             return img_dir
         else:
             # 创建新目录并复制非重复文件
@@ -121,39 +153,124 @@ class Duplication(BaseProcessor):
                 shutil.rmtree(final_output_path)
             final_output_path.mkdir(parents=True, exist_ok=True)
 
+            # 待删除文件都位于 img_dir 下，按文件名比较即可，
+            # 避免对每个 Path 计算哈希时重复的字符串化开销
+            remove_names = {p.name for p in files_to_remove_set}
+
             # 批量复制非重复文件（性能优化：减少单文件复制次数）
             file_list = [
                 item
                 for item in img_dir.iterdir()
-                if item.is_file() and item not in files_to_remove_set
+                if item.is_file() and item.name not in remove_names
             ]
 
+            # 同一文件系统内使用 reflink (写时复制)，开启 hardlink 时使用硬链接，
+            # 避免逐字节复制
+            same_device = os.stat(img_dir).st_dev == os.stat(final_output_path).st_dev
+            # 去重结果只关心文件内容和修改时间，跨设备时无需 copy2 的完整属性复制
+            copy_file = (
+                partial(link_or_copy, hardlink=hardlink)
+                if same_device
+                else copy_with_times
+            )
+
             for item in file_list:
                 try:
-                    shutil.copy2(item, final_output_path / item.name)
-                except shutil.Error as e:
+                    copy_file(item, final_output_path / item.name)
+                except OSError as e:
                     raise OSError(f"复制文件 {item.name} 时出错: {e}")
 
             return final_output_path
 
-    def _get_hasher(self, duplication_mode: DuplicationMode) -> HASHER_TYPE:
+    def _get_hasher(self, duplication_mode: DuplicationMode) -> "HASHER_TYPE":
         """
         根据去重模式获取对应的哈希器实例。
         私有方法。
+
+        imagededup 的导入会连带加载 torch，耗时较长，
+        因此延迟到真正需要哈希器时才导入。
         """
         # match语句是Python 3.10的新特性
         match duplication_mode:
             case DuplicationMode.Fastest:
+                from imagededup.methods import AHash
+
                 return AHash(verbose=False)
             case DuplicationMode.Normal:
+                from imagededup.methods import WHash
+
                 return WHash(verbose=False)
             case DuplicationMode.Best:
+                from imagededup.methods import PHash
+
                 return PHash(verbose=False)
             case DuplicationMode.CNN:
+                from imagededup.methods import CNN as CNNHasher
+
                 return CNNHasher(verbose=False)
             case _:
                 raise ValueError(f"未知的去重模式: {duplication_mode}")
 
+    def _encode_images_fast(
+        self, img_dir: Path, duplication_mode: DuplicationMode
+    ) -> Dict[str, str]:
+        """
+        使用 NumPy 批量计算目录中图片的 AHash/PHash 编码。
+        私有方法。
+
+        预处理与 imagededup 一致 (转 RGB、LANCZOS 缩放、转灰度)，
+        但整批图片的哈希在一次向量化运算中完成，得到的编码可以直接
+        交给 imagededup 的 find_duplicates 使用。
+
+        Args:
+            img_dir: 图片所在的目录。
+            duplication_mode: 去重模式，只支持 Fastest (AHash) 和 Best (PHash)。
+
+        Returns:
+            文件名到 16 位十六进制哈希字符串的映射。
+        """
+        target_size = _FAST_HASH_TARGET_SIZE[duplication_mode]
+
+        names: List[str] = []
+        arrays: List[np.ndarray] = []
+        for item in sorted(img_dir.iterdir()):
+            if item.name.startswith(".") or not item.is_file():
+                continue
+            try:
+                with Image.open(item) as img:
+                    if img.format not in _HASHABLE_FORMATS:
+                        continue
+                    if img.mode != "RGB":
+                        img = img.convert("RGBA").convert("RGB")
+                    img = img.resize(target_size, Image.Resampling.LANCZOS)
+                    arrays.append(np.asarray(img.convert("L"), dtype=np.float64))
+            except Exception as e:
+                loguru.logger.warning(f"无法读取图片 {item}: {e}")
+                continue
+            names.append(item.name)
+
+        if not arrays:
+            return {}
+
+        images = np.stack(arrays)
+        if duplication_mode == DuplicationMode.Fastest:
+            # AHash: 像素值不小于均值的位置为 1
+            means = images.mean(axis=(1, 2), keepdims=True)
+            hash_bits = (images >= means).reshape(len(images), -1)
+        else:
+            # scipy 导入较慢，与 imagededup 一样只在用到时才导入
+            from scipy.fftpack import dct
+
+            # PHash: 对整批图片做二维 DCT 后取左上角 8x8 系数，
+            # 与除直流分量外的中位数比较
+            coefficients = dct(dct(images, axis=1), axis=2)[:, :8, :8]
+            coefficients = coefficients.reshape(len(images), -1)
+            medians = np.median(coefficients[:, 1:], axis=1, keepdims=True)
+            hash_bits = coefficients >= medians
+
+        packed = np.packbits(hash_bits, axis=1)
+        return {name: row.tobytes().hex() for name, row in zip(names, packed)}
+
     def _resolve_duplicates(
         self,
         img_dir: Path,
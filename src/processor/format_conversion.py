@@ -1,12 +1,19 @@
-from concurrent.futures import as_completed, ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from typing import Final, Literal, Optional
+from typing import Any, Callable, Final, Literal, Optional
+import os
+import queue
 import shutil
+import stat
+import threading
 
+import numpy as np
 from PIL import Image
 from tqdm import tqdm
+from src.core import constants
 from src.processor import BaseProcessor
-from src.utils.io_uitls import IOuitls
+from src.utils.io_uitls import get_img_paths_by_dir, get_optimal_process_count
 import loguru
 
 # 定义支持的图片格式和对应的 Pillow 内部格式名称的映射
@@ -20,6 +27,15 @@ _FORMAT_MAP: Final[dict[str, str]] = {
     "webp": "WEBP",
 }
 
+# 不支持透明度、保存前需要将透明通道混合到白色背景上的格式
+_OPAQUE_FORMATS: Final[frozenset[str]] = frozenset(("JPEG", "BMP"))
+
+# 各格式保存时使用的额外参数
+_SAVE_KWARGS: Final[dict[str, dict[str, Any]]] = {
+    "JPEG": constants.JPEG_SAVE_KWARGS,
+    "WEBP": {"quality": 90},  # WebP默认使用90%质量
+}
+
 
 class FormatConversion(BaseProcessor):
     """将图片转换为指定格式的类"""
@@ -35,13 +51,16 @@ class FormatConversion(BaseProcessor):
     ) -> Path:
         """批量转换图片格式"""
         img_dir_path = Path(img_dir_path)
-        thread_num = thread_num if thread_num else IOuitls.get_optimal_process_count()
+        thread_num = thread_num if thread_num else get_optimal_process_count()
 
         if not img_dir_path.exists() or not img_dir_path.is_dir():
             raise ValueError(f"图片目录 '{img_dir_path}' 不存在或不是一个目录。")
 
+        # 只解析一次目标格式，避免每张图片重复做 lower() 和字典查找
+        pillow_format, target_suffix = self._resolve_format(target_format)
+
         # 获取目录下所有图片文件路径
-        img_paths = IOuitls.get_img_paths_by_dir(img_dir_path, recursion, suffix)
+        img_paths = get_img_paths_by_dir(img_dir_path, recursion, suffix)
 
         # 确定输出目录
         output_dir = (
@@ -50,48 +69,49 @@ class FormatConversion(BaseProcessor):
             else img_dir_path.with_name(img_dir_path.stem + f"_{target_format}")
         )
 
-        # 创建输出目录(如果不覆盖原图)
-        if not override:
+        # 预先计算每张图片的输出路径，工作进程直接写入最终位置
+        if override:
+            output_paths = [
+                self._determine_output_path(img_path, target_suffix, override)
+                for img_path in img_paths
+            ]
+        else:
+            # 保持原始目录结构，输出到新目录中
+            output_paths = [
+                output_dir
+                / img_path.relative_to(img_dir_path).with_suffix(target_suffix)
+                for img_path in img_paths
+            ]
+
+            # 创建输出目录及所需的子目录(若已存在则先删除)
             if output_dir.exists():
                 shutil.rmtree(output_dir)
-            output_dir.mkdir(parents=True, exist_ok=True)
-
-            # 记录一下原图片路径
-            detect_new_file_generator = IOuitls.detect_new_files(img_dir_path)
-            next(detect_new_file_generator)  # 第一次迭代，记录初始文件集
+            for parent in {output_dir} | {path.parent for path in output_paths}:
+                parent.mkdir(parents=True, exist_ok=True)
+
+        # 按块分发任务，减少每张图片一次的 Future 创建与进程间通信开销
+        tasks = self._skip_colliding_outputs(list(zip(img_paths, output_paths)))
+        chunksize = max(1, len(tasks) // (thread_num * 4))
+        batches = [tasks[i : i + chunksize] for i in range(0, len(tasks), chunksize)]
+        worker = partial(
+            FormatConversion._process_wrapper,
+            pillow_format=pillow_format,
+            flatten_alpha=pillow_format in _OPAQUE_FORMATS,
+            save_kwargs=_SAVE_KWARGS.get(pillow_format, {}),
+        )
 
         # 使用ProcessPoolExecutor进行多进程处理
         with ProcessPoolExecutor(max_workers=thread_num) as executor:
-            # 提交所有任务到进程池，使用静态方法
-            futures = [
-                executor.submit(
-                    FormatConversion._process_wrapper,
-                    img_path,
-                    target_format,
-                    override,
-                    None if override else output_dir,
-                )
-                for img_path in img_paths
-            ]
-
             # 使用tqdm创建进度条
             results = []
-            for future in tqdm(
-                as_completed(futures), total=len(futures), desc="转换格式", unit="张"
-            ):
-                result = future.result()
-                # 如果结果是错误消息，则打印出来
-                if isinstance(result, str) and result.startswith("Error"):
-                    loguru.logger.error(result)
-                results.append(result)
-
-        if not override:
-            # 第二次迭代，获取新增文件
-            new_files = next(detect_new_file_generator)
-            if new_files:
-                for new_file in new_files:
-                    # 移动文件
-                    shutil.move(new_file, output_dir / new_file.name)
+            with tqdm(total=len(tasks), desc="转换格式", unit="张") as progress:
+                for batch_results in executor.map(worker, batches):
+                    for result in batch_results:
+                        # 如果结果是错误消息，则打印出来
+                        if isinstance(result, str) and result.startswith("Error"):
+                            loguru.logger.error(result)
+                        results.append(result)
+                    progress.update(len(batch_results))
 
         return output_dir
 
@@ -119,69 +139,145 @@ class FormatConversion(BaseProcessor):
             Exception: 如果处理过程中出现其他错误。
         """
         img_path = Path(img_path)
-        if not img_path.exists():
-            raise FileNotFoundError(f"图片文件 {img_path} 不存在。")
-        if not img_path.is_file():
+        # 一次 stat 同时判断是否存在以及是否为普通文件
+        try:
+            st = os.stat(img_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"图片文件 {img_path} 不存在。") from None
+        if not stat.S_ISREG(st.st_mode):
             raise ValueError(f"提供的路径 {img_path} 不是一个文件。")
 
-        # 获取 Pillow 使用的格式名称
-        pillow_format = _FORMAT_MAP.get(target_format.lower())
-        if not pillow_format:
-            # 理论上 Literal 类型会限制输入，但作为防御性编程
-            raise ValueError(f"不支持的目标格式 {target_format}。")
+        return self.compile(target_format)(img_path, override)
+
+    def compile(
+        self, target_format: Literal["jpg", "jpeg", "png", "bmp", "webp"]
+    ) -> Callable[[Path, bool], Path]:
+        """预先解析目标格式，返回专用于该格式的单张图片转换函数。
+
+        格式映射、是否需要处理透明度以及保存参数都只在这里计算一次，
+        批量转换时复用返回的函数即可省去每张图片重复的查找和分支判断。
+
+        Args:
+            target_format: 目标格式 (jpg, jpeg, png, bmp, webp)。
+
+        Returns:
+            转换函数，接收 (图片路径, 是否覆盖原图)，返回处理后的图片路径。
+            该函数不再检查图片路径是否存在。
+
+        Raises:
+            ValueError: 如果格式不支持。
+        """
+        pillow_format, suffix = self._resolve_format(target_format)
+        flatten_alpha = pillow_format in _OPAQUE_FORMATS
+        save_kwargs = _SAVE_KWARGS.get(pillow_format, {})
+
+        def convert(img_path: Path, override: bool = True) -> Path:
+            output_path = self._determine_output_path(img_path, suffix, override)
+            img = self._load(img_path, flatten_alpha)
+            self._save(img, output_path, pillow_format, save_kwargs)
+            return output_path
+
+        return convert
+
+    def _load(self, img_path: Path, flatten_alpha: bool) -> Image.Image:
+        """内部方法：解码图片并转换为目标格式可以保存的模式。
+
+        Args:
+            img_path: 图片路径。
+            flatten_alpha: 目标格式是否不支持透明度 (例如 JPEG、BMP)。
 
-        # 打开图片
+        Returns:
+            已完成解码的图片。
+        """
+        # 打开图片并立即解码，保证解码工作在调用线程中完成
         img = Image.open(img_path)
+        img.load()
 
         # 对于某些格式，如PNG转JPG，可能需要处理透明度
-        if (pillow_format == "JPEG" or pillow_format == "BMP") and img.mode in (
-            "RGBA",
-            "LA",
-            "P",
-        ):
+        if flatten_alpha and img.mode in ("RGBA", "LA", "P"):
             # 如果图像有 alpha 通道或调色板模式，转换为 RGB
             # JPEG 和 BMP 不支持透明度，BMP通常也不支持索引色直接保存
 
-            # 创建一个白色背景的图像
-            background = Image.new("RGB", img.size, (255, 255, 255))
-
-            # 将原图粘贴到背景上（如果原图有alpha通道）
             # 对于P模式，先转RGBA再处理，或者直接转RGB
             if img.mode == "P" and "transparency" in img.info:
                 img = img.convert("RGBA")  # 确保调色板透明度被正确处理
 
             if img.mode == "RGBA" or img.mode == "LA":
-                background.paste(img, mask=img.split()[-1])  # 使用alpha通道作为mask
-                img = background
+                # 将原图按alpha通道混合到白色背景上
+                img = self._flatten_alpha(img)
             else:  # P模式（无透明度）或其他可以直接转RGB的模式
                 img = img.convert("RGB")
 
-        # 确定输出路径
-        output_path: Path = self._determine_output_path(
-            img_path, target_format, override
-        )
+        return img
 
-        # 确保输出目录存在
-        output_path.parent.mkdir(parents=True, exist_ok=True)
+    @staticmethod
+    def _save(
+        img: Image.Image,
+        output_path: Path,
+        pillow_format: str,
+        save_kwargs: dict[str, Any],
+    ) -> None:
+        """内部方法：按目标格式编码并保存图片。
 
-        # 保存图片
-        if pillow_format == "WEBP":
-            img.save(
-                output_path, format=pillow_format, quality=90
-            )  # WebP默认使用90%质量
-        else:
-            img.save(output_path, format=pillow_format)
+        Args:
+            img: 已解码的图片。
+            output_path: 输出路径，其所在目录需已存在。
+            pillow_format: Pillow 使用的格式名称 (例如 JPEG)。
+            save_kwargs: 保存时传给 Pillow 的额外参数。
+        """
+        img.save(output_path, format=pillow_format, **save_kwargs)
+
+    @staticmethod
+    def _flatten_alpha(img: Image.Image) -> Image.Image:
+        """内部方法：将带透明通道的图片混合到白色背景上并返回 RGB 图片。
+
+        使用 NumPy 一次性完成 `(rgb * a + 255 * (255 - a)) // 255` 的混合计算，
+        避免创建白色背景图片以及 split/paste 带来的额外整图拷贝。
+        中间结果最大为 255 * 255，可以用 uint16 整数运算完成，
+        比 float32 少一半的内存带宽。
+
+        Args:
+            img: RGBA 或 LA 模式的图片。
+
+        Returns:
+            混合后的 RGB 图片。
+        """
+        # 已是 RGBA 时直接取像素数据，避免 convert 再复制一整张图
+        rgba = img if img.mode == "RGBA" else img.convert("RGBA")
+        arr = np.asarray(rgba, dtype=np.uint8)
+        alpha = arr[..., 3:4].astype(np.uint16)
+        rgb = arr[..., :3].astype(np.uint16)
+        out = ((rgb * alpha + 255 * (255 - alpha)) // 255).astype(np.uint8)
+        return Image.fromarray(out, "RGB")
+
+    @staticmethod
+    def _resolve_format(target_format: str) -> tuple[str, str]:
+        """内部方法：解析目标格式，返回 Pillow 格式名称与输出后缀。
 
-        return output_path
+        Args:
+            target_format: 目标格式字符串 (jpg, jpeg, png, bmp, webp)。
+
+        Returns:
+            (Pillow 格式名称, 输出后缀) 元组，例如 ("JPEG", ".jpg")。
+
+        Raises:
+            ValueError: 如果格式不支持。
+        """
+        target_format = target_format.lower()
+        pillow_format = _FORMAT_MAP.get(target_format)
+        if not pillow_format:
+            # 理论上 Literal 类型会限制输入，但作为防御性编程
+            raise ValueError(f"不支持的目标格式 {target_format}。")
+        return pillow_format, f".{target_format}"
 
     def _determine_output_path(
-        self, img_path: Path, target_format: str, override: bool = True
+        self, img_path: Path, suffix: str, override: bool = True
     ) -> Path:
         """内部方法：根据 override 参数确定输出路径。
 
         Args:
             img_path: 原始图片路径。
-            target_format: 目标格式字符串。
+            suffix: 目标格式后缀 (例如 .jpg)。
             override: 是否覆盖原图。
 
         Returns:
@@ -189,53 +285,74 @@ class FormatConversion(BaseProcessor):
         """
         if override:
             # 覆盖原图，但修改后缀为目标格式
-            return img_path.with_suffix(f".{target_format.lower()}")
+            return img_path.with_suffix(suffix)
         else:
             # 不覆盖原图，在原文件名基础上添加 _out 后缀，并修改为目标格式后缀
-            return img_path.with_name(f"{img_path.stem}_out.{target_format.lower()}")
+            return img_path.with_name(f"{img_path.stem}_out{suffix}")
 
-    def _process_single_image(
-        self, img_path, target_format, override=True, output_dir=None
-    ):
-        try:
-            img_path = Path(img_path)
-            if override:
-                return self.process(
-                    img_path, target_format=target_format, override=override
-                )
-            else:
-                if output_dir:
-                    # 直接使用原始文件名创建目标路径，不保留原始目录结构
-                    final_path = output_dir / f"{img_path.stem}.{target_format}"
-
-                    # 处理文件并转换格式
-                    result = self.process(
-                        img_path, target_format=target_format, override=False
-                    )
-
-                    if result.exists():
-                        # 确保目标目录存在
-                        output_dir.mkdir(parents=True, exist_ok=True)
-                        # 复制到新位置
-                        shutil.copy2(result, final_path)
-                        # 删除原临时文件
-                        result.unlink()
-
-                    return final_path
-                else:
-                    return self.process(
-                        img_path, target_format=target_format, override=False
-                    )
-        except Exception as e:
-            return f"Error processing {img_path}: {e}"
+    @staticmethod
+    def _skip_colliding_outputs(
+        tasks: list[tuple[Path, Path]],
+    ) -> list[tuple[Path, Path]]:
+        """内部方法：多张图片的输出路径相同时只保留一张，其余跳过并记录警告。
+
+        例如 a.png 和 a.jpg 都转换为 a.webp 时，它们可能在不同进程中同时写入，
+        最终留下哪一张是不确定的。已经位于输出路径上的图片 (例如 a.webp 本身)
+        优先保留，避免被其他图片覆盖；否则保留排在前面的图片。
+
+        Args:
+            tasks: (图片路径, 输出路径) 列表。
+
+        Returns:
+            输出路径互不相同的 (图片路径, 输出路径) 列表。
+        """
+        kept: dict[str, tuple[Path, Path]] = {}
+        for img_path, output_path in tasks:
+            # Windows 上文件名不区分大小写
+            key = os.path.normcase(output_path)
+            winner = kept.get(key)
+            if winner is None:
+                kept[key] = (img_path, output_path)
+                continue
+            if os.path.normcase(img_path) == key:
+                kept[key], (img_path, output_path) = (img_path, output_path), winner
+            loguru.logger.warning(
+                f"跳过 {img_path}: 输出文件 {output_path} 与 {kept[key][0]} 相同"
+            )
+        return list(kept.values())
 
     @staticmethod
-    def _process_wrapper(img_path, target_format, override=True, output_dir=None):
+    def _process_wrapper(tasks, pillow_format, flatten_alpha, save_kwargs):
+        """在工作进程中处理一批图片：当前线程负责解码，后台线程负责编码保存，
+        使上一张图片的编码与下一张图片的解码重叠进行。"""
         # 创建新实例确保线程安全
         processor = FormatConversion()
-        return processor._process_single_image(
-            img_path, target_format, override, output_dir
-        )
+        results = []
+        save_queue: queue.Queue = queue.Queue(maxsize=2)
+
+        def _save_worker():
+            while (item := save_queue.get()) is not None:
+                img, img_path, output_path = item
+                try:
+                    processor._save(img, output_path, pillow_format, save_kwargs)
+                    results.append(output_path)
+                except Exception as e:
+                    results.append(f"Error processing {img_path}: {e}")
+
+        saver = threading.Thread(target=_save_worker, daemon=True)
+        saver.start()
+        for img_path, output_path in tasks:
+            try:
+                img = processor._load(Path(img_path), flatten_alpha)
+            except Exception as e:
+                results.append(f"Error processing {img_path}: {e}")
+                continue
+            save_queue.put((img, img_path, Path(output_path)))
+
+        # 通知后台线程结束并等待剩余图片保存完成
+        save_queue.put(None)
+        saver.join()
+        return results
 
 
 if __name__ == "__main__":
@@ -1,14 +1,52 @@
+import os
+import queue
 import shutil
-from concurrent.futures import as_completed
+import stat
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Callable, Final, Optional, Tuple
 
+import loguru
 from PIL import Image
 from tqdm import tqdm
 
+from src.core import constants
 from src.core.enums import Orientation, RotationMode
 from src.processor import BaseProcessor
-from src.utils.io_uitls import IOuitls
+from src.utils.io_uitls import (
+    get_img_paths_by_dir,
+    get_optimal_process_count,
+    get_image_size,
+    link_or_copy,
+)
+
+# jpegtran 可以直接在 DCT 系数层面无损旋转 JPEG，未安装时为 None
+_JPEGTRAN: Final[Optional[str]] = shutil.which("jpegtran")
+_JPEG_SUFFIXES: Final[tuple[str, ...]] = (".jpg", ".jpeg")
+
+# 旋转模式对应的 Pillow 变换：
+# ROTATE_270 是顺时针旋转90度，ROTATE_90 是逆时针旋转90度
+_TRANSPOSE_OPS: Final[dict[RotationMode, Image.Transpose]] = {
+    RotationMode.Clockwise: Image.Transpose.ROTATE_270,
+    RotationMode.CounterClockwise: Image.Transpose.ROTATE_90,
+}
+
+# 旋转模式对应的 jpegtran -rotate 参数 (顺时针角度)
+_JPEGTRAN_DEGREES: Final[dict[RotationMode, str]] = {
+    RotationMode.Clockwise: "90",
+    RotationMode.CounterClockwise: "270",
+}
+
+# 根据 (宽, 高) 判断图片是否需要旋转才能得到目标方向。
+# 只有严格纵向的图片需要转为横向，严格横向的图片需要转为纵向，
+# 正方形图片 (width == height) 既不是严格横向也不是严格纵向，不需要旋转。
+_NEEDS_ROTATION: Final[dict[Orientation, Callable[[int, int], bool]]] = {
+    Orientation.Horizontal: lambda width, height: height > width,
+    Orientation.Vertical: lambda width, height: width > height,
+}
 
 
 class Rotation(BaseProcessor):
@@ -25,16 +63,24 @@ class Rotation(BaseProcessor):
         recursion: bool = True,
         suffix: Optional[tuple[str, ...]] = None,
         override: bool = True,
+        hardlink: bool = False,
     ) -> Path:
-        """批量旋转图片"""
+        """批量旋转图片
+
+        不覆盖原图时，无需旋转的图片默认复制到输出目录。hardlink 设为 True 时改为
+        硬链接，不占用额外磁盘空间，但输出图片与原图是同一个文件，之后原地修改
+        输出目录 (例如再次以覆盖模式处理) 会同时修改原图。
+        """
         img_dir_path = Path(img_dir_path)
-        thread_num = thread_num if thread_num else IOuitls.get_optimal_process_count()
+        thread_num = thread_num if thread_num else get_optimal_process_count()
 
         if not img_dir_path.exists() or not img_dir_path.is_dir():
             raise ValueError(f"图片目录 '{img_dir_path}' 不存在或不是一个目录。")
 
         # 获取目录下所有图片文件路径
-        img_paths = IOuitls.get_img_paths_by_dir(img_dir_path, recursion, suffix)
+        img_paths = get_img_paths_by_dir(img_dir_path, recursion, suffix)
+        # 按文件大小从大到小排序(最长处理时间优先)，避免大图留在最后拖慢整体进度
+        img_paths.sort(key=lambda p: p.stat().st_size, reverse=True)
 
         # 确定输出目录
         output_dir = (
@@ -48,72 +94,130 @@ class Rotation(BaseProcessor):
             output_dir.mkdir(exist_ok=True)
             # 复制子目录结构
             if recursion:
-                for img_path in img_paths:
-                    # 计算相对路径，保持目录结构
-                    rel_path = img_path.relative_to(img_dir_path)
-                    # 确保目标目录的父目录存在
-                    target_dir = output_dir / rel_path.parent
+                # 计算相对路径，保持目录结构；每个目录只创建一次
+                target_dirs = {
+                    output_dir / img_path.relative_to(img_dir_path).parent
+                    for img_path in img_paths
+                }
+                for target_dir in target_dirs:
                     target_dir.mkdir(parents=True, exist_ok=True)
 
-        # 使用线程池而不是进程池（避免序列化问题）
-        from concurrent.futures import ThreadPoolExecutor
+        # 解码、旋转、编码都是 CPU 密集型操作，使用进程池绕开 GIL
+        # 准备每张图片的输出路径
+        if override:
+            target_paths = [None] * len(img_paths)
+        else:
+            target_paths = [
+                output_dir / img_path.relative_to(img_dir_path)
+                for img_path in img_paths
+            ]
+
+        # 按块分发任务，减少每张图片一次的 Future 创建与进程间通信开销；
+        # 每个工作进程内部再以 读取 -> 旋转 -> 保存 的流水线处理一批图片
+        tasks = list(zip(img_paths, target_paths))
+        chunksize = max(1, len(tasks) // (thread_num * 4))
+        batches = [tasks[i : i + chunksize] for i in range(0, len(tasks), chunksize)]
+        # 除路径外的参数对所有图片都相同，预先绑定
+        worker = partial(
+            Rotation._process_wrapper,
+            orientation=orientation,
+            rotation_mode=rotation_mode,
+            override=override,
+            hardlink=hardlink,
+        )
 
         results = []
-        with ThreadPoolExecutor(max_workers=thread_num) as executor:
-            # 准备任务参数列表
-            tasks = []
-            for img_path in img_paths:
-                if not override:
-                    rel_path = img_path.relative_to(img_dir_path)
-                    target_path = output_dir / rel_path
-                    tasks.append((img_path, target_path))
-                else:
-                    tasks.append((img_path, None))
-
-            # 创建任务并提交
-            futures = []
-            for img_path, target_path in tasks:
-                future = executor.submit(
-                    self._process_single_image,
-                    img_path=img_path,
-                    orientation=orientation,
-                    rotation_mode=rotation_mode,
-                    override=override,
-                    output_path=target_path,
-                )
-                futures.append(future)
-
+        with ProcessPoolExecutor(max_workers=thread_num) as executor:
+            futures = {executor.submit(worker, batch): batch for batch in batches}
             # 使用tqdm显示进度
-            for future in tqdm(
-                as_completed(futures), total=len(futures), desc="旋转图片", unit="张"
-            ):
+            with tqdm(total=len(tasks), desc="旋转图片", unit="张") as progress:
+                for future in as_completed(futures):
+                    batch = futures[future]
+                    # 单个批次失败 (例如工作进程异常退出) 时只跳过该批次，其他批次照常处理
+                    try:
+                        batch_results = future.result()
+                    except Exception as e:
+                        loguru.logger.error(
+                            f"处理图片时出错 ({batch[0][0]} 等 {len(batch)} 张): {e}"
+                        )
+                        progress.update(len(batch))
+                        continue
+                    for result in batch_results:
+                        # 如果结果是错误消息，则记录下来
+                        if isinstance(result, str) and result.startswith("Error"):
+                            loguru.logger.error(result)
+                        results.append(result)
+                    progress.update(len(batch_results))
+
+        return output_dir
+
+    @staticmethod
+    def _process_wrapper(tasks, orientation, rotation_mode, override, hardlink=False):
+        """在工作进程中以三段流水线处理一批图片：
+
+        读取线程解析尺寸并解码需要旋转的图片 (无需旋转或可无损旋转的图片直接完成)，
+        当前线程执行旋转，保存线程负责编码写入。各阶段之间通过有界队列连接，
+        下一张图片的读取、当前图片的旋转和上一张图片的保存同时进行。
+        """
+        # 创建新实例确保进程安全
+        processor = Rotation()
+        results = []
+        rotate_queue: queue.Queue = queue.Queue(maxsize=2)
+        save_queue: queue.Queue = queue.Queue(maxsize=2)
+
+        def _read_worker():
+            for img_path, output_path in tasks:
                 try:
-                    result = future.result()
-                    results.append(result)
+                    final_path = processor._resolve_output_path(
+                        img_path, override, output_path, dirs_prepared=True
+                    )
+                    width, height = processor._get_image_dimensions(img_path)
+                    if not _NEEDS_ROTATION[orientation](width, height):
+                        results.append(
+                            processor._finish_unrotated(
+                                img_path, final_path, override, hardlink
+                            )
+                        )
+                    elif processor._try_rotate_jpeg_lossless(
+                        img_path, final_path, rotation_mode
+                    ):
+                        results.append(final_path)
+                    else:
+                        img = processor._load_image(img_path)
+                        rotate_queue.put((img, img_path, final_path))
                 except Exception as e:
-                    print(f"处理图片时出错: {e}")
+                    results.append(f"Error processing {img_path}: {e}")
+            rotate_queue.put(None)
 
-        return output_dir
+        def _save_worker():
+            while (item := save_queue.get()) is not None:
+                img, save_kwargs, img_path, final_path = item
+                try:
+                    img.save(final_path, **save_kwargs)
+                    results.append(final_path)
+                except Exception as e:
+                    results.append(f"Error processing {img_path}: {e}")
+
+        reader = threading.Thread(target=_read_worker, daemon=True)
+        saver = threading.Thread(target=_save_worker, daemon=True)
+        reader.start()
+        saver.start()
+        while (item := rotate_queue.get()) is not None:
+            img, img_path, final_path = item
+            try:
+                rotated_img, save_kwargs = processor._rotate_image(
+                    img, rotation_mode, final_path
+                )
+            except Exception as e:
+                results.append(f"Error processing {img_path}: {e}")
+                continue
+            save_queue.put((rotated_img, save_kwargs, img_path, final_path))
 
-    def _process_single_image(
-        self,
-        img_path: Path,
-        orientation: Orientation,
-        rotation_mode: RotationMode,
-        override: bool,
-        output_path: Optional[Path] = None,
-    ):
-        """处理单个图片（用于并行处理）"""
-        try:
-            return self.process(
-                img_path,
-                orientation=orientation,
-                rotation_mode=rotation_mode,
-                override=override,
-                output_path=output_path,
-            )
-        except Exception as e:
-            return f"Error processing {img_path}: {e}"
+        # 通知保存线程结束并等待剩余图片保存完成
+        save_queue.put(None)
+        reader.join()
+        saver.join()
+        return results
 
     def process(
         self,
@@ -122,6 +226,7 @@ class Rotation(BaseProcessor):
         rotation_mode: RotationMode = RotationMode.Clockwise,
         override: bool = True,
         output_path: Optional[Path] = None,
+        hardlink: bool = False,
     ) -> Optional[Path]:
         """旋转图片
 
@@ -131,6 +236,7 @@ class Rotation(BaseProcessor):
             rotation_mode: 旋转模式 (Clockwise 或 CounterClockwise)。
             override: 是否覆盖原图 (True 则修改原图，False 则保存为带 `_out` 后缀的新文件)。
             output_path: 指定输出路径（当递归处理目录时使用）
+            hardlink: 不覆盖且无需旋转时，是否以硬链接代替复制原图 (输出与原图共享同一文件)
 
         Returns:
             处理后的图片路径；如果处理成功。
@@ -141,41 +247,21 @@ class Rotation(BaseProcessor):
             Exception: 如果处理过程中出现其他错误。
         """
         img_path = Path(img_path)
-        if not img_path.exists():
-            raise FileNotFoundError(f"图片路径 '{img_path}' 不存在。")
-        if not img_path.is_file():
+        # 一次 stat 同时判断是否存在以及是否为普通文件
+        try:
+            st = os.stat(img_path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"图片路径 '{img_path}' 不存在。") from None
+        if not stat.S_ISREG(st.st_mode):
             raise ValueError(f"提供的路径 '{img_path}' 不是一个文件。")
 
         # 获取图片尺寸
         width, height = self._get_image_dimensions(img_path)
 
-        # 根据严格不等判断当前朝向
-        is_currently_horizontal = width > height
-        is_currently_vertical = height > width
-        # 正方形图片 (width == height) 在此定义下既不是严格横向也不是严格纵向。
-
-        needs_rotation = False
-        match orientation:
-            case Orientation.Horizontal:
-                # 如果目标是横向 且 当前是严格纵向，则需要旋转
-                if is_currently_vertical:
-                    needs_rotation = True
-            case Orientation.Vertical:
-                # 如果目标是纵向 且 当前是严格横向，则需要旋转
-                if is_currently_horizontal:
-                    needs_rotation = True
-
-        final_path: Path
-        if override:
-            final_path = img_path
-        else:
-            # 如果指定了输出路径，则使用指定路径
-            if output_path:
-                final_path = output_path
-            else:
-                # 在扩展名之前创建带有 "_out" 后缀的新路径
-                new_stem = img_path.stem + "_out"
-                final_path = img_path.with_stem(new_stem)  # pathlib 会正确处理后缀
+        # 根据严格不等判断当前朝向是否与目标方向相反
+        needs_rotation = _NEEDS_ROTATION[orientation](width, height)
+
+        final_path = self._resolve_output_path(img_path, override, output_path)
 
         if needs_rotation:
             success = self._perform_rotation_and_save(
@@ -185,16 +271,67 @@ class Rotation(BaseProcessor):
                 raise RuntimeError(f"旋转并保存图片 '{img_path}' 失败。")
             return final_path
         else:
-            # 不需要旋转
-            if override:
-                # 如果覆盖且不需要旋转，则原文件保持不变，即为结果。
-                return img_path
-            else:
-                # 如果不覆盖且不需要旋转，则将原文件复制到新的路径。
-                success = self._copy_file(img_path, final_path)
-                if not success:
-                    raise RuntimeError(f"复制 '{img_path}' 到 '{final_path}' 失败。")
-                return final_path
+            return self._finish_unrotated(img_path, final_path, override, hardlink)
+
+    def _resolve_output_path(
+        self,
+        img_path: Path,
+        override: bool,
+        output_path: Optional[Path] = None,
+        dirs_prepared: bool = False,
+    ) -> Path:
+        """
+        私有方法：确定图片的最终保存路径。
+
+        Args:
+            img_path: 原始图片的路径。
+            override: 是否覆盖原图。
+            output_path: 指定的输出路径 (当递归处理目录时使用)。
+            dirs_prepared: 输出目录是否已由调用方创建。
+
+        Returns:
+            最终保存路径。
+        """
+        if override:
+            return img_path
+
+        # 如果指定了输出路径，则使用指定路径
+        if output_path:
+            final_path = output_path
+        else:
+            # 在扩展名之前创建带有 "_out" 后缀的新路径
+            new_stem = img_path.stem + "_out"
+            final_path = img_path.with_stem(new_stem)  # pathlib 会正确处理后缀
+
+        # 为了确保目录存在
+        if not dirs_prepared:
+            final_path.parent.mkdir(parents=True, exist_ok=True)
+        return final_path
+
+    def _finish_unrotated(
+        self, img_path: Path, final_path: Path, override: bool, hardlink: bool
+    ) -> Path:
+        """
+        私有方法：处理不需要旋转的图片。
+
+        Args:
+            img_path: 原始图片的路径。
+            final_path: 最终保存路径。
+            override: 是否覆盖原图。
+            hardlink: 是否以硬链接代替复制原图。
+
+        Returns:
+            处理后的图片路径。
+        """
+        if override:
+            # 如果覆盖且不需要旋转，则原文件保持不变，即为结果。
+            return img_path
+
+        # 如果不覆盖且不需要旋转，则将原文件复制到新的路径。
+        success = self._copy_file(img_path, final_path, hardlink)
+        if not success:
+            raise RuntimeError(f"复制 '{img_path}' 到 '{final_path}' 失败。")
+        return final_path
 
     def _get_image_dimensions(self, img_path: Path) -> Tuple[int, int]:
         """
@@ -210,8 +347,8 @@ class Rotation(BaseProcessor):
             FileNotFoundError: 如果文件不存在。
             Exception: 如果无法处理图片。
         """
-        with Image.open(img_path) as img:
-            return img.width, img.height
+        # 只解析文件头获取尺寸，真正需要旋转时才完整解码
+        return get_image_size(img_path)
 
     def _perform_rotation_and_save(
         self,
@@ -224,7 +361,7 @@ class Rotation(BaseProcessor):
 
         Args:
             original_img_path: 原始图片的路径。
-            target_save_path: 旋转后图片应保存的路径。
+            target_save_path: 旋转后图片应保存的路径，其所在目录需已存在。
             rotation_mode: 旋转模式 (顺时针或逆时针)。
 
         Returns:
@@ -234,39 +371,145 @@ class Rotation(BaseProcessor):
             FileNotFoundError: 如果原始文件不存在。
             Exception: 如果旋转或保存过程中出现错误。
         """
-        with Image.open(original_img_path) as img:
-            rotated_img: Optional[Image.Image] = None
-            match rotation_mode:
-                case RotationMode.Clockwise:
-                    # Pillow的 transpose(Image.Transpose.ROTATE_270) 是顺时针旋转90度
-                    rotated_img = img.transpose(Image.Transpose.ROTATE_270)
-                case RotationMode.CounterClockwise:
-                    # Pillow的 transpose(Image.Transpose.ROTATE_90) 是逆时针旋转90度
-                    rotated_img = img.transpose(Image.Transpose.ROTATE_90)
-
-            if rotated_img:
-                # 确保图片模式适合保存 (例如，JPEG不支持alpha通道)
-                # 如果目标是JPEG且图像有Alpha通道(RGBA)或调色板透明(P)，则转换为RGB
-                save_suffix_lower = target_save_path.suffix.lower()
-                if save_suffix_lower in [".jpg", ".jpeg"]:
-                    if rotated_img.mode == "RGBA" or (
-                        rotated_img.mode == "P" and "transparency" in rotated_img.info
-                    ):
-                        rotated_img = rotated_img.convert("RGB")
+        # JPEG 到 JPEG 的旋转优先走无损变换，省去完整的解码和重新编码
+        if self._try_rotate_jpeg_lossless(
+            original_img_path, target_save_path, rotation_mode
+        ):
+            return True
+
+        img = self._load_image(original_img_path)
+        rotated_img, save_kwargs = self._rotate_image(
+            img, rotation_mode, target_save_path
+        )
+        rotated_img.save(target_save_path, **save_kwargs)
+        return True
+
+    def _load_image(self, img_path: Path) -> Image.Image:
+        """
+        私有方法：打开图片并在当前线程完成解码。
+
+        Args:
+            img_path: 图片文件的路径。
+
+        Returns:
+            已解码的图片。
+        """
+        with Image.open(img_path) as img:
+            img.load()
+            return img
+
+    def _rotate_image(
+        self,
+        img: Image.Image,
+        rotation_mode: RotationMode,
+        target_save_path: Path,
+    ) -> Tuple[Image.Image, dict]:
+        """
+        私有方法：旋转已解码的图片，并根据目标格式准备保存参数。
 
-                # 为了确保目录存在
-                target_save_path.parent.mkdir(parents=True, exist_ok=True)
-                rotated_img.save(target_save_path)
-                return True
-            return False  # 如果图片未能成功打开或处理
+        Args:
+            img: 已解码的图片。
+            rotation_mode: 旋转模式 (顺时针或逆时针)。
+            target_save_path: 旋转后图片应保存的路径。
 
-    def _copy_file(self, source_path: Path, destination_path: Path) -> bool:
+        Returns:
+            (旋转后的图片, 保存参数)。
+
+        Raises:
+            ValueError: 如果旋转模式不受支持。
+        """
+        transpose_op = _TRANSPOSE_OPS.get(rotation_mode)
+        if transpose_op is None:
+            raise ValueError(f"不支持的旋转模式: {rotation_mode}")
+        rotated_img = img.transpose(transpose_op)
+
+        # 确保图片模式适合保存 (例如，JPEG不支持alpha通道)
+        # 如果目标是JPEG且图像有Alpha通道(RGBA)或调色板透明(P)，则转换为RGB
+        save_kwargs = {}
+        if target_save_path.suffix.lower() in _JPEG_SUFFIXES:
+            if rotated_img.mode == "RGBA" or (
+                rotated_img.mode == "P" and "transparency" in rotated_img.info
+            ):
+                rotated_img = rotated_img.convert("RGB")
+            save_kwargs = constants.JPEG_SAVE_KWARGS
+        return rotated_img, save_kwargs
+
+    def _try_rotate_jpeg_lossless(
+        self,
+        original_img_path: Path,
+        target_save_path: Path,
+        rotation_mode: RotationMode,
+    ) -> bool:
+        """
+        私有方法：输入和输出都是 JPEG 时尝试无损旋转。
+
+        Returns:
+            无损旋转成功时返回 True，否则返回 False (需要回退到 Pillow)。
+        """
+        return (
+            original_img_path.suffix.lower() in _JPEG_SUFFIXES
+            and target_save_path.suffix.lower() in _JPEG_SUFFIXES
+            and self._rotate_jpeg_lossless(
+                original_img_path, target_save_path, rotation_mode
+            )
+        )
+
+    def _rotate_jpeg_lossless(
+        self,
+        original_img_path: Path,
+        target_save_path: Path,
+        rotation_mode: RotationMode,
+    ) -> bool:
+        """
+        私有方法：使用 jpegtran 无损旋转 JPEG 图片。
+
+        Args:
+            original_img_path: 原始 JPEG 图片的路径。
+            target_save_path: 旋转后图片应保存的路径，其所在目录需已存在。
+            rotation_mode: 旋转模式 (顺时针或逆时针)。
+
+        Returns:
+            如果无损旋转成功则返回 True；jpegtran 不可用或图片尺寸不是
+            MCU 的整数倍 (无法完美旋转) 时返回 False，由调用方回退到 Pillow。
+        """
+        if _JPEGTRAN is None:
+            return False
+
+        degrees = _JPEGTRAN_DEGREES[rotation_mode]
+
+        # 先写入临时文件再替换，保证覆盖原图时不会读写同一个文件
+        tmp_path = target_save_path.with_name(f".{target_save_path.name}.tmp")
+        result = subprocess.run(
+            [
+                _JPEGTRAN,
+                "-rotate",
+                degrees,
+                "-perfect",
+                "-copy",
+                "none",
+                "-outfile",
+                str(tmp_path),
+                str(original_img_path),
+            ],
+            capture_output=True,
+        )
+        if result.returncode != 0:
+            tmp_path.unlink(missing_ok=True)
+            return False
+
+        os.replace(tmp_path, target_save_path)
+        return True
+
+    def _copy_file(
+        self, source_path: Path, destination_path: Path, hardlink: bool = False
+    ) -> bool:
         """
         私有方法：复制文件。
 
         Args:
             source_path: 源文件的路径。
-            destination_path: 目标文件的路径。
+            destination_path: 目标文件的路径，其所在目录需已存在。
+            hardlink: 是否优先使用硬链接，失败时 (例如跨文件系统) 回退到 reflink/复制。
 
         Returns:
             如果复制成功则返回 True，否则返回 False。
@@ -274,9 +517,12 @@ class Rotation(BaseProcessor):
         Raises:
             Exception: 如果文件复制过程出现任何错误。
         """
-        # 为了确保目录存在
-        destination_path.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(source_path, destination_path)  # copy2 会保留元数据
+        if hardlink:
+            # 链接要求目标不存在，重复运行时先移除上一次的结果
+            destination_path.unlink(missing_ok=True)
+            link_or_copy(source_path, destination_path, hardlink=True)
+        else:
+            shutil.copy2(source_path, destination_path)  # copy2 会保留元数据
         return True
 
 
@@ -1,7 +1,9 @@
+import functools
+import queue
 import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
 from pathlib import Path
-from typing import Literal, Optional
+from typing import Callable, Final, Literal, Optional, Sequence
 
 import GPUtil
 import loguru
@@ -11,7 +13,77 @@ from waifu2x_ncnn_py import Waifu2x
 
 from src.core import constants
 from src.core.enums import SuperResolutionModel
-from src.utils.io_uitls import IOuitls
+from src.utils.io_uitls import (
+    get_img_paths_by_dir,
+    get_optimal_process_count,
+    get_image_size,
+)
+
+
+# 流水线各阶段之间的队列长度，以及阻塞等待时检查中止标记的间隔 (秒)
+_PIPELINE_QUEUE_SIZE: Final[int] = 2
+_PIPELINE_POLL_INTERVAL: Final[float] = 0.1
+
+
+class _PipelineAborted(Exception):
+    """流水线的其他阶段出错，当前阶段应停止"""
+
+
+class _SharedWaifu2x:
+    """在多个线程之间共享的 Waifu2x 实例
+
+    ncnn-vulkan 没有保证同一个实例的 process 可重入，缓存的实例可能被多个调用方
+    线程同时使用，因此每个实例的推理调用都用各自的锁串行执行。
+    """
+
+    def __init__(self, waifu2x: Waifu2x):
+        self._waifu2x = waifu2x
+        self._lock = threading.Lock()
+
+    def process_pil(self, image: Image.Image) -> Image.Image:
+        """对图片进行超分推理
+
+        Args:
+            image (Image.Image): 输入图片
+
+        Returns:
+            超分后的图片
+        """
+        with self._lock:
+            return self._waifu2x.process_pil(image)
+
+
+@functools.lru_cache(maxsize=8)
+def _get_waifu2x(gpu_id: int, scale: int, noise: int, model: str) -> _SharedWaifu2x:
+    """按参数缓存 Waifu2x 实例，相同参数重复调用时复用已加载到 GPU 的模型
+
+    Args:
+        gpu_id (int): GPU 编号，-1 表示使用 CPU
+        scale (int): 放大倍数
+        noise (int): 降噪等级
+        model (str): 超分模型名称
+
+    Returns:
+        可在多个线程之间共享的 Waifu2x 实例
+    """
+    return _SharedWaifu2x(Waifu2x(gpuid=gpu_id, scale=scale, noise=noise, model=model))
+
+
+@functools.cache
+def _get_gpu_id() -> int:
+    """获取第一个可用的 GPU 编号，结果会被缓存
+
+    GPUtil 每次查询都要启动 nvidia-smi 子进程，耗时远超从缓存中取出模型。
+
+    Returns:
+        GPU 编号，没有可用的 GPU 时返回 -1 (使用 CPU)
+    """
+    try:
+        available_gpus = GPUtil.getFirstAvailable()
+    except RuntimeError:
+        # 没有可用的 GPU 时 GPUtil 会抛出异常，此时回退到 CPU
+        available_gpus = []
+    return available_gpus[0] if available_gpus else -1
 
 
 class SuperResolution:
@@ -42,13 +114,17 @@ class SuperResolution:
             处理后的图片所在目录路径
         """
         img_dir_path = Path(img_dir_path)
-        thread_num = thread_num if thread_num else IOuitls.get_optimal_process_count()
+        thread_num = thread_num if thread_num else get_optimal_process_count()
 
         if not img_dir_path.exists() or not img_dir_path.is_dir():
             raise ValueError(f"图片目录 '{img_dir_path}' 不存在或不是一个目录。")
 
         # 获取目录下所有图片文件路径
-        img_paths = IOuitls.get_img_paths_by_dir(img_dir_path, recursion, suffix)
+        img_paths = get_img_paths_by_dir(img_dir_path, recursion, suffix)
+        # 按像素数从大到小排序(最长处理时间优先)，避免大图留在最后拖慢整体进度；
+        # 尺寸相同的图片排在一起连续送入 GPU，ncnn 可以复用同尺寸的显存分配。
+        # 尺寸只解析文件头获得，不解码图片
+        img_paths.sort(key=self._get_shape_key, reverse=True)
 
         # 确定输出目录
         output_dir = (
@@ -57,57 +133,75 @@ class SuperResolution:
             else img_dir_path.with_name(f"{img_dir_path.stem}_sr{scale}x")
         )
 
-        # 创建输出目录(如果不覆盖原图)
-        if not override:
-            if output_dir.exists():
-                shutil.rmtree(output_dir)
-            output_dir.mkdir(parents=True, exist_ok=True)
-
-            # 记录一下原图片路径
-            detect_new_file_generator = IOuitls.detect_new_files(img_dir_path)
-            next(detect_new_file_generator)  # 第一次迭代，记录初始文件集
-
-        # 使用ThreadPoolExecutor进行多线程处理
-        with ThreadPoolExecutor(max_workers=thread_num) as executor:
-            # 提交所有任务到线程池
-            futures = [
-                executor.submit(
-                    self._process_single_image,
-                    img_path,
-                    noise,
-                    scale,
-                    model,
-                    override,
-                )
+        # 预先计算每张图片的输出路径，工作线程直接写入最终位置，
+        # 无需事后扫描新增文件再移动、重命名
+        if override:
+            output_paths = [None] * len(img_paths)
+        else:
+            # 保持原始目录结构，输出到新目录中
+            output_paths = [
+                output_dir / img_path.relative_to(img_dir_path)
                 for img_path in img_paths
             ]
 
-            # 使用tqdm创建进度条
-            results = []
-            desc = f"超分辨率处理(放大{scale}倍，降噪{noise})"
-            for future in tqdm(
-                as_completed(futures), total=len(futures), desc=desc, unit="张"
-            ):
-                result = future.result()
-                # 如果结果是错误消息，则打印出来
-                if isinstance(result, str) and result.startswith("Error"):
-                    loguru.logger.error(result)
-                results.append(result)
-
-        if not override:
-            # 第二次迭代，获取新增文件
-            new_files = next(detect_new_file_generator)
-            if new_files:
-                for new_file in new_files:
-                    # 移动文件
-                    print(new_file.name.removesuffix("_out"))
-                    shutil.move(new_file, output_dir / new_file.name)
+            # 创建输出目录及所需的子目录(若已存在则先删除)
+            if output_dir.exists():
+                shutil.rmtree(output_dir)
+            for parent in {output_dir} | {path.parent for path in output_paths}:
+                parent.mkdir(parents=True, exist_ok=True)
 
-            for i in output_dir.glob("**/*_out*"):
-                i.rename(i.with_stem(i.stem.removesuffix("_out")))
+        self.process_batch(
+            img_paths, noise, scale, model, override, output_paths, thread_num
+        )
 
         return output_dir
 
+    def process_batch(
+        self,
+        img_paths: Sequence[Path | str],
+        noise: Literal[-1, 0, 1, 2, 3] = 0,
+        scale: Literal[1, 2, 3, 4] = 2,
+        model: SuperResolutionModel = SuperResolutionModel.UpconvAnime,
+        override: bool = True,
+        output_paths: Optional[Sequence[Optional[Path]]] = None,
+        thread_num: Optional[int] = None,
+    ) -> list[Path | str]:
+        """对一组图片进行超分辨率处理
+
+        所有图片共用一个 Waifu2x 实例，模型加载和 GPU 上下文创建只做一次，
+        解码、推理和编码以流水线方式同时进行。
+
+        Args:
+            img_paths (Sequence[Path | str]): 图片路径列表
+            noise (Literal[-1, 0, 1, 2, 3]): 降噪等级
+            scale (Literal[1, 2, 3, 4], optional): 放大倍数. Defaults to 2.
+            model (SuperResolutionModel, optional): 超分模型. Defaults to SuperResolutionModel.UpconvAnime.
+            override (bool, optional): 是否覆盖原图. Defaults to True.
+            output_paths (Sequence[Optional[Path]], optional): 与 img_paths 一一对应的输出路径，
+                不覆盖原图且未指定时保存为原图旁带 `_out` 后缀的新文件
+            thread_num (int, optional): 解码和编码阶段各自的线程数
+
+        Returns:
+            每张图片的输出路径，处理失败时为错误信息 (顺序与输入不一定相同)
+        """
+        img_paths = [Path(img_path) for img_path in img_paths]
+        if output_paths is None:
+            output_paths = [None] * len(img_paths)
+        thread_num = thread_num if thread_num else get_optimal_process_count()
+
+        waifu2x = self._create_waifu2x(noise, scale, model)
+
+        # 使用tqdm创建进度条
+        desc = f"超分辨率处理(放大{scale}倍，降噪{noise})"
+        with tqdm(total=len(img_paths), desc=desc, unit="张") as progress:
+            return self._run_pipeline(
+                list(zip(img_paths, output_paths)),
+                waifu2x.process_pil,
+                override,
+                thread_num,
+                progress,
+            )
+
     def process(
         self,
         img_path: Path | str,
@@ -132,37 +226,272 @@ class SuperResolution:
         if not img_path.exists():
             raise FileNotFoundError(f"File {img_path} not found.")
 
+        waifu2x = self._create_waifu2x(noise, scale, model)
+        return self._upscale_image(img_path, waifu2x.process_pil, override)
+
+    @staticmethod
+    def _get_shape_key(img_path: Path) -> tuple[int, int, int]:
+        """获取用于排序的 (像素数, 宽, 高)，无法解析的图片排在最后
+
+        Args:
+            img_path (Path): 图片路径
+
+        Returns:
+            (像素数, 宽, 高)
+        """
+        try:
+            width, height = get_image_size(img_path)
+        except Exception:
+            # 损坏的图片交给解码阶段报告错误
+            return (0, 0, 0)
+        return (width * height, width, height)
+
+    def _create_waifu2x(
+        self,
+        noise: Literal[-1, 0, 1, 2, 3],
+        scale: Literal[1, 2, 3, 4],
+        model: SuperResolutionModel,
+    ) -> _SharedWaifu2x:
+        """获取 Waifu2x 实例，优先使用第一个可用的 GPU
+
+        GPU 编号和相同参数的实例都会被缓存复用，避免每次调用都重新查询 GPU
+        和加载模型，不再需要时可调用 clear_cache 释放。同一个实例的推理调用
+        会加锁串行执行，多个线程同时调用 process/process_batch 也是安全的。
+
+        Args:
+            noise (Literal[-1, 0, 1, 2, 3]): 降噪等级
+            scale (Literal[1, 2, 3, 4]): 放大倍数
+            model (SuperResolutionModel): 超分模型
+
+        Returns:
+            可在多个线程之间共享的 Waifu2x 实例
+        """
+        return _get_waifu2x(_get_gpu_id(), scale, noise, model.value)
+
+    @staticmethod
+    def clear_cache() -> None:
+        """释放缓存的 Waifu2x 实例 (以及其占用的显存)，下次使用时重新选择 GPU"""
+        _get_waifu2x.cache_clear()
+        _get_gpu_id.cache_clear()
+
+    def _upscale_image(
+        self,
+        img_path: Path | str,
+        infer: Callable[[Image.Image], Image.Image],
+        override: bool = True,
+        output_path: Optional[Path] = None,
+    ) -> Path:
+        """对单张图片进行超分辨率处理
+
+        Args:
+            img_path (Path, str): 图片路径
+            infer (Callable[[Image.Image], Image.Image]): 执行超分推理的函数，
+                例如 Waifu2x.process_pil
+            override (bool, optional): 是否覆盖原图. Defaults to True.
+            output_path (Path, optional): 不覆盖原图时的输出路径，
+                不填则保存为原图旁带 `_out` 后缀的新文件
+
+        Returns:
+            输出图片路径
+        """
+        img_path = Path(img_path)
+        image = self._load_image(img_path)
+        image = infer(image)
+        return self._save_image(image, img_path, override, output_path)
+
+    def _load_image(self, img_path: Path) -> Image.Image:
+        """检查图片格式并在当前线程完成解码
+
+        文件不存在时 Image.open 会抛出 FileNotFoundError，这里不再单独检查。
+
+        Args:
+            img_path (Path): 图片路径
+
+        Returns:
+            已解码的图片
+        """
         input_img_suffix = img_path.suffix.lower()
         if input_img_suffix not in constants.COMMON_IMAGE_SUFFIXES:
             raise ValueError(f"Unsupported image format: {input_img_suffix}")
 
-        gpu_id = GPUtil.getFirstAvailable()[0] if GPUtil.getFirstAvailable() else -1
-        waifu2x = Waifu2x(gpuid=gpu_id, scale=scale, noise=noise, model=model.value)
         with Image.open(str(img_path)) as image:
-            image = waifu2x.process_pil(image)
-            if override:
-                output_img_path = img_path
-                image.save(str(output_img_path), quality=95)
-            else:
-                output_img_path = img_path.with_stem(f"{img_path.stem}_out")
-                image.save(str(output_img_path), quality=95)
-            return output_img_path
-
-    # 用于多线程处理的方法
-    def _process_single_image(
+            image.load()
+            return image
+
+    def _save_image(
         self,
-        img_path,
-        noise=0,
-        scale=2,
-        model=SuperResolutionModel.UpconvAnime,
-        override=True,
-    ):
-        try:
-            return self.process(
-                img_path, noise=noise, scale=scale, model=model, override=override
+        image: Image.Image,
+        img_path: Path,
+        override: bool = True,
+        output_path: Optional[Path] = None,
+    ) -> Path:
+        """保存超分后的图片
+
+        Args:
+            image (Image.Image): 超分后的图片
+            img_path (Path): 原图片路径
+            override (bool, optional): 是否覆盖原图. Defaults to True.
+            output_path (Path, optional): 不覆盖原图时的输出路径，
+                不填则保存为原图旁带 `_out` 后缀的新文件
+
+        Returns:
+            输出图片路径
+        """
+        if override:
+            output_img_path = img_path
+        elif output_path:
+            output_img_path = output_path
+        else:
+            output_img_path = img_path.with_stem(f"{img_path.stem}_out")
+        image.save(str(output_img_path), quality=95)
+        return output_img_path
+
+    def _run_pipeline(
+        self,
+        tasks: list[tuple[Path, Optional[Path]]],
+        infer: Callable[[Image.Image], Image.Image],
+        override: bool,
+        thread_num: int,
+        progress: tqdm,
+    ) -> list[Path | str]:
+        """以三段流水线批量处理图片：解码线程 -> GPU 线程 -> 编码线程
+
+        各阶段之间通过长度为 2 的队列连接，磁盘读取、GPU 推理和编码写入同时进行，
+        整体吞吐量取决于最慢的一段而不是三段之和。推理只在唯一的 GPU 线程中执行，
+        避免多个线程争抢 GPU。同时存在的已解码/已超分图片不超过 max(thread_num, 3) 张，
+        放大倍数较大时内存占用不会随线程数成倍增长。
+
+        单张图片的错误只记录为该图片的结果；某一阶段出现其他错误时，
+        设置中止标记让所有阶段尽快退出，并在线程全部结束后重新抛出该错误。
+
+        Args:
+            tasks (list[tuple[Path, Optional[Path]]]): (图片路径, 输出路径) 列表
+            infer (Callable[[Image.Image], Image.Image]): 执行超分推理的函数
+            override (bool): 是否覆盖原图
+            thread_num (int): 解码和编码阶段各自的线程数
+            progress (tqdm): 每处理完一张图片更新一次的进度条
+
+        Returns:
+            每张图片的输出路径，处理失败时为错误信息
+
+        Raises:
+            Exception: 流水线某一阶段出现单张图片之外的错误时重新抛出
+        """
+        task_queue: queue.Queue = queue.Queue()
+        gpu_queue: queue.Queue = queue.Queue(maxsize=_PIPELINE_QUEUE_SIZE)
+        write_queue: queue.Queue = queue.Queue(maxsize=_PIPELINE_QUEUE_SIZE)
+        in_flight = threading.BoundedSemaphore(max(thread_num, 3))
+        abort = threading.Event()
+        errors: list[BaseException] = []
+        results: list[Path | str] = []
+        results_lock = threading.Lock()
+
+        # 阻塞操作都带超时并检查中止标记，其他阶段失败后不会一直等待
+        def put(q: queue.Queue, item) -> None:
+            while not abort.is_set():
+                try:
+                    q.put(item, timeout=_PIPELINE_POLL_INTERVAL)
+                    return
+                except queue.Full:
+                    pass
+            raise _PipelineAborted
+
+        def get(q: queue.Queue):
+            while not abort.is_set():
+                try:
+                    return q.get(timeout=_PIPELINE_POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+            raise _PipelineAborted
+
+        def acquire() -> None:
+            while not abort.is_set():
+                if in_flight.acquire(timeout=_PIPELINE_POLL_INTERVAL):
+                    return
+            raise _PipelineAborted
+
+        def finish(result: Path | str) -> None:
+            # 图片处理完 (无论成功与否) 后释放名额
+            in_flight.release()
+            with results_lock:
+                # 如果结果是错误消息，则打印出来
+                if isinstance(result, str):
+                    loguru.logger.error(result)
+                results.append(result)
+                progress.update(1)
+
+        # 每个解码线程各消费一个结束标记
+        for task in tasks:
+            task_queue.put(task)
+        for _ in range(thread_num):
+            task_queue.put(None)
+
+        def decode_worker():
+            while (task := task_queue.get()) is not None:
+                img_path, output_path = task
+                acquire()
+                try:
+                    image = self._load_image(img_path)
+                except Exception as e:
+                    finish(f"Error processing {img_path}: {e}")
+                    continue
+                put(gpu_queue, (image, img_path, output_path))
+            put(gpu_queue, None)
+
+        def gpu_worker():
+            # 所有解码线程都结束后，再通知每个编码线程结束
+            finished_decoders = 0
+            while finished_decoders < thread_num:
+                item = get(gpu_queue)
+                if item is None:
+                    finished_decoders += 1
+                    continue
+                image, img_path, output_path = item
+                try:
+                    image = infer(image)
+                except Exception as e:
+                    finish(f"Error processing {img_path}: {e}")
+                    continue
+                put(write_queue, (image, img_path, output_path))
+            for _ in range(thread_num):
+                put(write_queue, None)
+
+        def write_worker():
+            while (item := get(write_queue)) is not None:
+                image, img_path, output_path = item
+                try:
+                    output = self._save_image(image, img_path, override, output_path)
+                except Exception as e:
+                    finish(f"Error processing {img_path}: {e}")
+                    continue
+                finish(output)
+
+        def run_stage(stage: Callable[[], None]) -> None:
+            try:
+                stage()
+            except _PipelineAborted:
+                pass
+            except BaseException as e:
+                with results_lock:
+                    errors.append(e)
+                abort.set()
+
+        threads = [
+            threading.Thread(target=run_stage, args=(stage,))
+            for stage in (
+                [decode_worker] * thread_num
+                + [gpu_worker]
+                + [write_worker] * thread_num
             )
-        except Exception as e:
-            return f"Error processing {img_path}: {e}"
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+        return results
 
 
 if __name__ == "__main__":
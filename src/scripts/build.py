@@ -6,6 +6,8 @@ import shutil
 from pathlib import Path
 import winsound
 
+from src.utils.pillow_utils import PillowUtils
+
 dist_path = Path(r"E:\load\python\Tools\img_tools\dist")
 
 if dist_path.exists():
@@ -17,18 +19,57 @@ start_time = time.time()
 os.chdir(dist_path)
 
 
+# 固定哈希种子，使打包时模块收集的顺序在多次构建之间保持一致
+build_env = {**os.environ, "PYTHONHASHSEED": "0"}
+
+
 def pyinstaller_build():
-    command = r'pyinstaller --noconfirm --onedir --console --hidden-import=numpy --hidden-import=opencv-python "E:\load\python\Tools\img_tools\img_tools.py"'
+    command = [
+        "pyinstaller",
+        "--noconfirm",
+        "--onedir",
+        "--console",
+        "--hidden-import=numpy",
+        "--hidden-import=opencv-python",
+        r"E:\load\python\Tools\img_tools\img_tools.py",
+    ]
 
-    subprocess.run(command, shell=True, check=True)
+    subprocess.run(command, check=True, env=build_env)
 
 
 def nuitka_build():
-    command = r'"E:\load\python\Tools\img_tools\.venv\Scripts\python.exe" -m nuitka --standalone --show-progress --show-memory --mingw64 --disable-ccache --assume-yes-for-downloads --warn-implicit-exceptions --output-dir="E:\load\python\Tools\img_tools\dist" --main="E:\load\python\Tools\img_tools\img_tools.py" --windows-icon-from-ico="E:\load\python\Project\NuitkaGUI\dependence\logo.ico" --enable-plugins=upx,no-qt,matplotlib --include-package=torch --include-module=torch'
-    subprocess.run(command, shell=True, check=True)
+    command = [
+        r"E:\load\python\Tools\img_tools\.venv\Scripts\python.exe",
+        "-m",
+        "nuitka",
+        "--standalone",
+        "--show-progress",
+        "--show-memory",
+        "--mingw64",
+        "--disable-ccache",
+        "--assume-yes-for-downloads",
+        "--warn-implicit-exceptions",
+        r"--output-dir=E:\load\python\Tools\img_tools\dist",
+        r"--main=E:\load\python\Tools\img_tools\img_tools.py",
+        r"--windows-icon-from-ico=E:\load\python\Project\NuitkaGUI\dependence\logo.ico",
+        "--enable-plugins=upx,no-qt,matplotlib",
+        "--include-package=torch",
+        "--include-module=torch",
+    ]
+    subprocess.run(command, check=True, env=build_env)
+
+
+def check_libjpeg_turbo():
+    """打包前确认 Pillow 链接了 libjpeg-turbo，否则打包出的程序 JPEG 编解码会慢数倍"""
+    if not PillowUtils.has_libjpeg_turbo():
+        loguru.logger.warning(
+            "当前环境的 Pillow 未链接 libjpeg-turbo，"
+            "请先执行 pip install --force-reinstall --only-binary=:all: pillow 后再打包"
+        )
 
 
 if __name__ == "__main__":
+    check_libjpeg_turbo()
     # nuitka_build()
     pyinstaller_build()
 
@@ -1,83 +1,531 @@
+import functools
 import multiprocessing
+import os
+import shutil
+import struct
+import sys
+import time
 from pathlib import Path
-from typing import Optional, Iterator
+from typing import Any, BinaryIO, Callable, Iterable, Literal, Optional, Iterator
+
+from PIL import Image
 
 from src.core import constants
 
+__all__ = [
+    "IOuitls",
+    "get_img_paths_by_dir",
+    "get_optimal_process_count",
+    "imap_paths",
+    "detect_new_files",
+    "watch_new_files",
+    "get_image_size",
+    "copy_with_times",
+    "link_or_copy",
+]
+
+# Linux 上用于创建 reflink (写时复制克隆) 的 ioctl 请求码
+_FICLONE = 0x40049409
+
+# 默认允许的图片后缀名 (已转为小写)，模块加载时只构建一次
+_DEFAULT_SUFFIXES: tuple[str, ...] = tuple(
+    s.lower() for s in constants.COMMON_IMAGE_SUFFIXES
+)
+
+
+def get_img_paths_by_dir(
+    dir_path: Path,
+    recursion: bool = True,
+    suffix: Optional[tuple[str, ...]] = None,
+    exclude_dirs: Optional[frozenset[str]] = None,
+) -> list[Path]:
+    """
+    获取目录下所有图片文件的路径列表。
+
+    Args:
+        dir_path (Path): 目录路径。
+        recursion (bool): 是否递归查找子目录中的图片文件。
+        suffix (tuple[str, ...], optional): 允许的图片文件后缀名列表。
+            如果为 None，则使用默认的常见图片后缀名。
+        exclude_dirs (frozenset[str], optional): 递归时跳过的目录名。
+            如果为 None，则使用 constants.DEFAULT_EXCLUDE_DIRS。
+
+    Returns:
+        list[Path]: 按路径排序的图片文件路径列表。
+    """
+    # 自定义后缀名只在入口处统一转为以点开头的小写形式，
+    # 遍历时直接交给 str.endswith 做匹配
+    suffix_allowed = (
+        tuple(s if s.startswith(".") else f".{s}" for s in map(str.lower, suffix))
+        if suffix
+        else _DEFAULT_SUFFIXES
+    )
+    if exclude_dirs is None:
+        exclude_dirs = constants.DEFAULT_EXCLUDE_DIRS
+
+    img_paths: list[Path] = []
+    pending_dirs = [os.fspath(dir_path)]
+    while pending_dirs:
+        files, sub_dirs = _scan_dir(pending_dirs.pop(), suffix_allowed, exclude_dirs)
+        img_paths.extend(files)
+        if recursion:
+            pending_dirs.extend(sub_dirs)
+    # 按路径排序，处理顺序不依赖文件系统返回目录项的顺序
+    return sorted(img_paths)
+
+
+def _scan_dir(
+    dir_path: str, suffix_allowed: tuple[str, ...], exclude_dirs: frozenset[str]
+) -> tuple[list[Path], list[str]]:
+    """
+    扫描单个目录 (不递归)，返回其中的图片文件和子目录。
+
+    使用 os.scandir，目录项自带文件类型信息，
+    判断是否为目录/文件时无需像 rglob + is_file() 那样额外 stat。
+    与 rglob 一样，无法读取的目录或目录项 (例如没有权限) 会被跳过，不会抛出异常。
+
+    Args:
+        dir_path (str): 目录路径。
+        suffix_allowed (tuple[str, ...]): 允许的图片文件后缀名 (小写，以点开头)。
+        exclude_dirs (frozenset[str]): 不返回的子目录名。
+
+    Returns:
+        tuple[list[Path], list[str]]: (图片文件路径列表, 子目录路径列表)。
+    """
+    files: list[Path] = []
+    sub_dirs: list[str] = []
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                try:
+                    _classify_entry(
+                        entry, suffix_allowed, exclude_dirs, files, sub_dirs
+                    )
+                except OSError:
+                    # 无法读取类型的目录项 (例如没有权限的符号链接目标) 直接跳过
+                    continue
+    except OSError:
+        # 与 rglob 一致，跳过无法读取的目录
+        # (例如 Windows 磁盘根目录下的 "System Volume Information")
+        pass
+    return files, sub_dirs
+
+
+def _classify_entry(
+    entry: os.DirEntry,
+    suffix_allowed: tuple[str, ...],
+    exclude_dirs: frozenset[str],
+    files: list[Path],
+    sub_dirs: list[str],
+) -> None:
+    """
+    判断目录项是子目录还是符合条件的图片，并加入对应的列表。
+
+    Args:
+        entry (os.DirEntry): os.scandir 返回的目录项。
+        suffix_allowed (tuple[str, ...]): 允许的图片文件后缀名 (小写，以点开头)。
+        exclude_dirs (frozenset[str]): 不返回的子目录名。
+        files (list[Path]): 图片文件路径列表。
+        sub_dirs (list[str]): 子目录路径列表。
+
+    Raises:
+        OSError: 如果无法获取目录项的类型。
+    """
+    # 与 rglob 一致，不进入指向目录的符号链接
+    if entry.is_dir(follow_symlinks=False):
+        # 在目录项阶段就剪掉无关目录，之后不会再打开它们
+        if entry.name not in exclude_dirs:
+            sub_dirs.append(entry.path)
+        return
+
+    # 后缀名绝大多数是小写的，先用 C 实现的 str.endswith 直接匹配，
+    # 不符合时才转为小写再匹配一次，只为符合条件的文件创建 Path 对象
+    name = entry.name
+    if (name.endswith(suffix_allowed) or name.lower().endswith(suffix_allowed)) and (
+        # 与 Path.suffix 一致，整个文件名就是后缀 (如 ".png") 时不算图片
+        name.rfind(".") > 0
+        # 普通文件直接使用目录项中缓存的类型，不会触发 stat；
+        # 只有符号链接才需要跟随到目标判断是否为文件
+        and (
+            entry.is_file(follow_symlinks=False)
+            or (entry.is_symlink() and entry.is_file())
+        )
+    ):
+        files.append(Path(entry.path))
+
+
+@functools.cache
+def get_optimal_process_count() -> int:
+    """获取适合的进程数量
+
+    优先使用当前进程实际可用的 CPU 核心数 (受 CPU 亲和性/容器限制影响)，
+    避免在容器中按宿主机核心数创建过多进程。结果在进程内缓存。
+    """
+    try:
+        # Linux 上返回当前进程允许运行的 CPU 集合
+        cpu_count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # os.process_cpu_count 在 Python 3.13+ 才可用
+        process_cpu_count = getattr(os, "process_cpu_count", None)
+        cpu_count = (
+            process_cpu_count() if process_cpu_count else None
+        ) or multiprocessing.cpu_count()
+    # 计算适合的进程数量，约占80%的性能
+    return max(1, cpu_count * 4 // 5)
+
+
+def imap_paths(
+    fn: Callable[[Path], Any],
+    paths: Iterable[Path],
+    workers: Optional[int] = None,
+) -> Iterator[Any]:
+    """
+    在进程池中对每个路径调用 fn，按完成顺序逐个返回结果。
+
+    使用 imap_unordered，任务按块从 paths 中惰性取出，不会预先为每个路径
+    创建任务对象，先完成的结果先返回，耗时长的图片不会阻塞其他结果。
+    支持 forkserver 时使用 forkserver 启动进程，否则使用平台默认方式：调用方此时
+    通常已有进度条线程等在运行，在多线程进程中直接 fork 可能让子进程继承到
+    被其他线程持有的锁而死锁。
+
+    Args:
+        fn (Callable[[Path], Any]): 处理单个路径的函数，必须可被 pickle
+            (模块级函数、静态方法或其 functools.partial)。
+        paths (Iterable[Path]): 路径序列，可以是生成器。
+        workers (int, optional): 进程数，为 None 时使用 get_optimal_process_count()。
+
+    Yields:
+        Any: fn 的返回值 (顺序与 paths 不一定相同)。
+    """
+    workers = workers if workers else get_optimal_process_count()
+    # 已知任务总数时每个进程大约分到 4 块，兼顾调度开销和负载均衡
+    chunksize = max(1, len(paths) // (workers * 4)) if hasattr(paths, "__len__") else 1
+    context = (
+        multiprocessing.get_context("forkserver")
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else multiprocessing.get_context()
+    )
+    with context.Pool(processes=workers) as pool:
+        yield from pool.imap_unordered(fn, paths, chunksize=chunksize)
+
+
+def detect_new_files(directory_path: str | Path) -> Iterator[list[Path] | None]:
+    """
+    使用 yield 实现文件差值检测。
+
+    第一次迭代生成器时，它会记录目录中的初始文件集并 yield None。
+    第二次迭代生成器时，它会 yield 一个列表，包含新添加到目录中的文件的绝对路径。
+
+    参数:
+        directory_path (str): 要监控的文件夹路径。
+
+    Yields:
+        None: 第一次迭代时。
+        list[str]: 第二次迭代时，返回新增文件的路径列表。
+
+    Raises:
+        ValueError: 如果提供的路径不是一个有效的目录。
+    """
+    path_obj = Path(directory_path)
+    if not path_obj.is_dir():
+        raise ValueError(f"提供的路径 '{directory_path}' 不是一个有效的目录。")
+    # 两次快照都在同一目录下，只需记录文件名；目录本身用 abspath 转为绝对路径
+    # (纯字符串运算)，不像 resolve() 那样逐级解析符号链接
+    path_obj = Path(os.path.abspath(path_obj))
+
+    # 第一次调用 next() 时执行: 记录初始文件状态
+    initial_files = _snapshot_dir(path_obj)
+
+    # 第一次 yield
+    yield None
+
+    # 第二次调用 next() 时执行: 重新获取文件列表并找出新增文件
+    current_files = _snapshot_dir(path_obj)
+
+    # 只为新增的文件创建 Path 对象
+    # 按目录读取顺序返回，与文件系统自身的顺序一致
+    newly_added_files_paths = [
+        path_obj / name for name in current_files if name not in initial_files
+    ]
+
+    # 第二次 yield
+    yield newly_added_files_paths
+
+
+def watch_new_files(
+    directory_path: str | Path,
+    mode: Literal["auto", "notify", "poll"] = "auto",
+    poll_interval: float = 1.0,
+) -> Iterator[list[Path]]:
+    """
+    持续监控目录，每当有新文件加入时 yield 新增文件的路径列表。
+
+    notify 模式使用 watchfiles (可选依赖，通过 `img-tools[watch]` 安装)
+    订阅系统的文件变化通知 (Linux 上为 inotify，Windows 上为 ReadDirectoryChangesW)，
+    空闲时不占用 CPU，也不需要反复遍历目录。
+    网络文件系统 (如 NFS、SMB) 上通常收不到变化通知，此时应使用 poll 模式，
+    每隔 poll_interval 秒对目录做一次快照并与上一次比较。
+    auto 模式在安装了 watchfiles 时使用 notify，否则使用 poll。
+
+    生成器不会自行结束，调用方处理完所需的文件后直接退出循环即可。
+
+    Args:
+        directory_path (str | Path): 要监控的文件夹路径 (不包括子目录)。
+        mode (Literal["auto", "notify", "poll"]): 监控方式。
+        poll_interval (float): poll 模式下两次快照之间的间隔秒数。
+
+    Yields:
+        list[Path]: 新增文件的绝对路径列表。
+
+    Raises:
+        ValueError: 如果提供的路径不是一个有效的目录。
+        ImportError: 如果 mode 为 notify 但没有安装 watchfiles。
+    """
+    path_obj = Path(directory_path)
+    if not path_obj.is_dir():
+        raise ValueError(f"提供的路径 '{directory_path}' 不是一个有效的目录。")
+    path_obj = Path(os.path.abspath(path_obj))
+
+    watchfiles = None
+    if mode != "poll":
+        try:
+            import watchfiles
+        except ImportError:
+            if mode == "notify":
+                raise
+
+    if watchfiles is not None:
+        for changes in watchfiles.watch(path_obj, recursive=False):
+            added = [
+                Path(path)
+                for change, path in changes
+                if change == watchfiles.Change.added and os.path.isfile(path)
+            ]
+            if added:
+                yield added
+        return
+
+    previous_files = _snapshot_dir(path_obj)
+    while True:
+        time.sleep(poll_interval)
+        current_files = _snapshot_dir(path_obj)
+        added_files = [
+            path_obj / name for name in current_files if name not in previous_files
+        ]
+        previous_files = current_files
+        if added_files:
+            yield added_files
+
+
+def _snapshot_dir(dir_path: Path) -> dict[str, None]:
+    """
+    记录目录直属文件 (不包括子目录中的文件) 的快照。
+
+    os.scandir 的目录项自带文件类型信息，
+    生成快照时不需要对每个文件额外 stat。
+    使用 dict 而不是 set，查找同样是 O(1)，同时保留目录读取顺序。
+
+    Args:
+        dir_path (Path): 目录路径。
+
+    Returns:
+        dict[str, None]: 以文件名为键的字典。
+    """
+    with os.scandir(dir_path) as entries:
+        return dict.fromkeys(
+            entry.name for entry in entries if entry.is_file(follow_symlinks=False)
+        )
+
+
+def get_image_size(img_path: Path) -> tuple[int, int]:
+    """
+    只解析文件头获取图片尺寸，不创建解码器。
+
+    支持 PNG、GIF、BMP、WebP 和 JPEG，其他格式或无法解析的文件
+    回退到 Pillow 打开图片获取尺寸。
+
+    Args:
+        img_path (Path): 图片文件路径。
+
+    Returns:
+        tuple[int, int]: 图片的 (宽度, 高度)。
+    """
+    size: Optional[tuple[int, int]] = None
+    with open(img_path, "rb") as f:
+        head = f.read(32)
+        if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+            size = struct.unpack(">II", head[16:24])
+        elif head[:6] in (b"GIF87a", b"GIF89a"):
+            size = struct.unpack("<HH", head[6:10])
+        elif head[:2] == b"BM" and len(head) >= 26:
+            if struct.unpack("<I", head[14:18])[0] == 12:
+                # OS/2 BITMAPCOREHEADER 使用 16 位无符号宽高
+                size = struct.unpack("<HH", head[18:22])
+            else:
+                # 高度为负数表示自上而下存储的位图
+                width, height = struct.unpack("<ii", head[18:26])
+                size = (width, abs(height))
+        elif head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            size = _get_webp_size(head)
+        elif head[:2] == b"\xff\xd8":
+            size = _get_jpeg_size(f)
+
+    if size is None:
+        with Image.open(img_path) as img:
+            return img.size
+    return size
+
+
+def _get_webp_size(head: bytes) -> Optional[tuple[int, int]]:
+    """
+    从 WebP 文件的前 32 字节解析尺寸。
+
+    Args:
+        head (bytes): 文件开头的字节。
+
+    Returns:
+        Optional[tuple[int, int]]: 图片的 (宽度, 高度)，无法解析时返回 None。
+    """
+    if len(head) < 30:
+        return None
+    chunk = head[12:16]
+    if chunk == b"VP8X":
+        # 扩展格式：画布宽高减一，各 24 位小端
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return width, height
+    if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+        # 有损格式：关键帧起始码之后为 14 位宽高
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and head[20] == 0x2F:
+        # 无损格式：签名之后依次为 14 位的宽减一和高减一
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    return None
+
+
+def _get_jpeg_size(f: BinaryIO) -> Optional[tuple[int, int]]:
+    """
+    逐个跳过 JPEG 段，直到找到 SOF 段并解析尺寸。
+
+    Args:
+        f (BinaryIO): 以二进制模式打开的 JPEG 文件。
+
+    Returns:
+        Optional[tuple[int, int]]: 图片的 (宽度, 高度)，无法解析时返回 None。
+    """
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        # 跳过段之间的填充字节，定位到下一个标记
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":
+            byte = f.read(1)
+        if not byte:
+            return None
+
+        marker = byte[0]
+        # 独立标记没有长度字段
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            continue
+
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack(">H", length_bytes)[0]
+
+        # SOF0~SOF15，排除 DHT(C4)、JPG(C8)、DAC(CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack(">HH", data[1:5])
+            return width, height
+
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def copy_with_times(src: Path, dst: Path) -> None:
+    """
+    复制文件内容，并只保留源文件的访问/修改时间。
+
+    相比 shutil.copy2 (内部调用 copystat，会额外执行 chmod、chflags、
+    xattr 复制等多次系统调用)，这里只需一次 stat 和一次 utime。
+
+    Args:
+        src (Path): 源文件路径。
+        dst (Path): 目标文件路径。
+    """
+    # 复制前读取时间，复制时读取源文件会更新它的访问时间
+    st = os.stat(src)
+    shutil.copyfile(src, dst)
+    os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+
+def link_or_copy(src: Path, dst: Path, hardlink: bool = False) -> None:
+    """
+    以尽量不复制数据的方式把文件放到目标位置。
+
+    默认尝试 reflink (写时复制克隆，仅 Linux 上支持的文件系统，如 btrfs/xfs)，
+    之后修改任一文件都不会影响另一个；不支持时回退到 copy_with_times 完整复制。
+
+    hardlink 为 True 时优先使用硬链接。硬链接与源文件是同一个文件，
+    原地修改目标文件会同时改变源文件，只应在确定不会原地修改输出时开启。
+
+    Args:
+        src (Path): 源文件路径。
+        dst (Path): 目标文件路径，必须尚不存在。
+        hardlink (bool): 是否优先以硬链接代替复制，默认为 False。
+
+    Raises:
+        FileExistsError: 如果目标文件已存在。
+    """
+    if os.path.lexists(dst):
+        raise FileExistsError(f"目标文件 '{dst}' 已存在。")
+
+    if hardlink:
+        try:
+            os.link(src, dst)
+            return
+        except FileExistsError:
+            raise
+        except OSError:
+            # 跨文件系统或文件系统不支持硬链接时，回退到 reflink/复制
+            pass
+
+    if sys.platform.startswith("linux"):
+        import fcntl
+
+        # "xb" 只在目标不存在时创建文件，打开失败时不会删除任何已有文件
+        with open(src, "rb") as fsrc, open(dst, "xb") as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                cloned = True
+            except OSError:
+                cloned = False
+        if cloned:
+            st = os.stat(src)
+            os.utime(dst, ns=(st.st_atime_ns, st.st_mtime_ns))
+            return
+        # 文件系统不支持 reflink，删除本次调用创建的空文件
+        os.unlink(dst)
+
+    copy_with_times(src, dst)
+
 
 class IOuitls:
-    @staticmethod
-    def get_img_paths_by_dir(
-        dir_path: Path, recursion: bool = True, suffix: Optional[tuple[str, ...]] = None
-    ) -> list[Path]:
-        """
-        获取目录下所有图片文件的路径列表。
-
-        Args:
-            dir_path (Path): 目录路径。
-            recursion (bool): 是否递归查找子目录中的图片文件。
-            suffix (tuple[str, ...], optional): 允许的图片文件后缀名列表。
-                如果为 None，则使用默认的常见图片后缀名。
-
-        Returns:
-            list[Path]: 图片文件路径列表。
-        """
-        img_paths = []
-        img_generator = dir_path.glob("*") if not recursion else dir_path.rglob("*")
-        suffix_allowed = suffix if suffix else constants.COMMON_IMAGE_SUFFIXES
-        for img_path in img_generator:
-            if img_path.is_file() and img_path.suffix.lower() in suffix_allowed:
-                img_paths.append(img_path)
-        return img_paths
-
-    @staticmethod
-    def get_optimal_process_count() -> int:
-        """获取适合的进程数量"""
-        # 获取系统中的CPU核心数量
-        cpu_count = multiprocessing.cpu_count()
-        # 计算适合的进程数量，约占80%的性能
-        optimal_process_count = max(1, int(cpu_count * 0.8))
-        return optimal_process_count
-
-    @staticmethod
-    def detect_new_files(directory_path: str | Path) -> Iterator[list[Path] | None]:
-        """
-        使用 yield 实现文件差值检测。
-
-        第一次迭代生成器时，它会记录目录中的初始文件集并 yield None。
-        第二次迭代生成器时，它会 yield 一个列表，包含新添加到目录中的文件的绝对路径。
-
-        参数:
-            directory_path (str): 要监控的文件夹路径。
-
-        Yields:
-            None: 第一次迭代时。
-            list[str]: 第二次迭代时，返回新增文件的路径列表。
-
-        Raises:
-            ValueError: 如果提供的路径不是一个有效的目录。
-        """
-        path_obj = Path(directory_path)
-        if not path_obj.is_dir():
-            raise ValueError(f"提供的路径 '{directory_path}' 不是一个有效的目录。")
-
-        # 第一次调用 next() 时执行: 记录初始文件状态
-        # 使用 resolve() 获取绝对路径，确保一致性
-        # glob('*') 只查找目录直属文件，不包括子目录中的文件
-        initial_files = set(p.resolve() for p in path_obj.glob("*") if p.is_file())
-
-        # 第一次 yield
-        yield None
-
-        # 第二次调用 next() 时执行: 重新获取文件列表并找出新增文件
-        current_files = set(p.resolve() for p in path_obj.glob("*") if p.is_file())
-
-        newly_added_files_paths = [f for f in (current_files - initial_files)]
-
-        # 第二次 yield
-        yield newly_added_files_paths
-
-
-if __name__ == "__main__":
-    io_utils = IOuitls()
-    print(io_utils.get_optimal_process_count())
+    """兼容外部旧代码的命名空间，各方法与同名的模块级函数相同
+
+    项目内部直接导入模块级函数，省去每次调用时的类属性查找。
+    """
+
+    get_img_paths_by_dir = staticmethod(get_img_paths_by_dir)
+    get_optimal_process_count = staticmethod(get_optimal_process_count)
+    imap_paths = staticmethod(imap_paths)
+    detect_new_files = staticmethod(detect_new_files)
+    watch_new_files = staticmethod(watch_new_files)
+    get_image_size = staticmethod(get_image_size)
+    copy_with_times = staticmethod(copy_with_times)
+    link_or_copy = staticmethod(link_or_copy)
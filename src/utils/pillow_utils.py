@@ -0,0 +1,54 @@
+import PIL
+import loguru
+from PIL import features
+
+
+class PillowUtils:
+    @staticmethod
+    def is_pillow_simd() -> bool:
+        """
+        判断当前加载的 Pillow 是否为 Pillow-SIMD 构建。
+
+        Pillow-SIMD 的版本号带有 `.postN` 后缀 (例如 9.5.0.post1)，
+        而官方 Pillow 的正式版本不会带有该后缀。
+
+        Returns:
+            bool: 如果是 Pillow-SIMD 则返回 True，否则返回 False。
+        """
+        return ".post" in PIL.__version__
+
+    @staticmethod
+    def log_build_info() -> None:
+        """
+        在日志中记录当前 Pillow 的构建信息，便于确认是否使用了 SIMD 加速版本。
+        """
+        if PillowUtils.is_pillow_simd():
+            loguru.logger.debug(f"使用 Pillow-SIMD {PIL.__version__}")
+        else:
+            loguru.logger.debug(
+                f"使用 Pillow {PIL.__version__}，"
+                "安装 Pillow-SIMD 可以加速图片模式转换、缩放和混合等操作"
+            )
+
+    @staticmethod
+    def has_libjpeg_turbo() -> bool:
+        """
+        判断当前 Pillow 是否链接了 libjpeg-turbo。
+
+        libjpeg-turbo 使用 SIMD 加速 JPEG 的编解码，比原版 libjpeg 快数倍。
+
+        Returns:
+            bool: 如果链接了 libjpeg-turbo 则返回 True，否则返回 False。
+        """
+        return bool(features.check_feature("libjpeg_turbo"))
+
+    @staticmethod
+    def warn_if_no_libjpeg_turbo() -> None:
+        """
+        如果当前 Pillow 没有链接 libjpeg-turbo，则在日志中给出警告。
+        """
+        if not PillowUtils.has_libjpeg_turbo():
+            loguru.logger.warning(
+                "当前 Pillow 未链接 libjpeg-turbo，JPEG 编解码速度会明显变慢，"
+                "建议安装官方 Pillow 的预编译版本"
+            )
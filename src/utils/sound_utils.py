@@ -1,25 +1,90 @@
-import winsound
+import atexit
+import queue
+import sys
+import threading
+from typing import Optional
+
 import loguru
 
+if sys.platform == "win32":
+    import winsound
+else:
+    winsound = None
+
 
 class SoundUtils:
+    # Pending beep requests, consumed by a single background thread
+    _beep_queue: queue.Queue = queue.Queue(maxsize=1)
+    _beep_thread: Optional[threading.Thread] = None
+    _beep_lock = threading.Lock()
+
     @staticmethod
     def play_sound(sound_file: str):
         """
         Play a sound file using the winsound module.
+        Playback is asynchronous, so the caller is not blocked.
+        Does nothing on non-Windows platforms.
         :param sound_file: Path to the sound file.
         """
+        if winsound is None:
+            return
         try:
-            winsound.PlaySound(sound_file, winsound.SND_FILENAME)
+            winsound.PlaySound(
+                sound_file,
+                winsound.SND_FILENAME | winsound.SND_ASYNC | winsound.SND_NODEFAULT,
+            )
         except Exception as e:
             loguru.logger.error(f"Error playing sound: {e}")
 
     @staticmethod
     def beep():
         """
-        Play a beep sound.
+        Play a beep sound on a background thread and return immediately.
+        A beep requested while another one is still waiting to play is merged
+        into it. Pending beeps are played before the interpreter exits.
+        Does nothing on non-Windows platforms.
         """
+        if winsound is None:
+            return
+        SoundUtils._ensure_beep_thread()
         try:
-            winsound.Beep(1000, 500)  # Frequency: 1000 Hz, Duration: 500 ms
-        except Exception as e:
-            loguru.logger.error(f"Error playing beep sound: {e}")
+            SoundUtils._beep_queue.put_nowait(None)
+        except queue.Full:
+            # A beep is already waiting to play, so this request is covered by it
+            pass
+
+    @staticmethod
+    def wait_for_beeps():
+        """
+        Block until every queued beep has finished playing.
+        """
+        if SoundUtils._beep_thread is not None:
+            SoundUtils._beep_queue.join()
+
+    @staticmethod
+    def _ensure_beep_thread():
+        """
+        Lazily start the daemon thread that plays queued beeps.
+        Daemon threads are killed at exit, so an exit hook waits for pending beeps.
+        """
+        with SoundUtils._beep_lock:
+            if SoundUtils._beep_thread is None:
+                SoundUtils._beep_thread = threading.Thread(
+                    target=SoundUtils._beep_worker, daemon=True
+                )
+                SoundUtils._beep_thread.start()
+                atexit.register(SoundUtils.wait_for_beeps)
+
+    @staticmethod
+    def _beep_worker():
+        """
+        Play one beep for each queued request.
+        """
+        while True:
+            SoundUtils._beep_queue.get()
+            try:
+                winsound.Beep(1000, 500)  # Frequency: 1000 Hz, Duration: 500 ms
+            except Exception as e:
+                loguru.logger.error(f"Error playing beep sound: {e}")
+            finally:
+                SoundUtils._beep_queue.task_done()
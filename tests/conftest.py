@@ -0,0 +1,136 @@
+import atexit
+import functools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+import pytest
+from PIL import Image
+
+from src.utils.io_uitls import get_image_size
+
+# 收集测试时一次性注册 Pillow 的全部格式插件，
+# 避免第一个打开 WebP 等图片的测试承担插件的导入开销
+Image.init()
+
+# 后台删除测试目录的线程，退出前等待它们全部结束
+_removal_threads: list[threading.Thread] = []
+
+
+@atexit.register
+def _join_removal_threads() -> None:
+    for thread in _removal_threads:
+        thread.join()
+
+
+# Linux 下由本文件在内存文件系统中创建的临时根目录，测试结束后删除
+_SHM_DIR = "/dev/shm"
+_shm_basetemp: Optional[str] = None
+
+
+def pytest_configure(config) -> None:
+    """Linux 下把 tmp_path 的根目录放到 /dev/shm (tmpfs) 中，测试读写图片不经过磁盘
+
+    命令行指定了 --basetemp 时使用指定的目录；pytest-xdist 的工作进程会从主进程
+    继承 basetemp，因此同样不再重复创建。其他平台使用 pytest 默认的临时目录。
+    """
+    global _shm_basetemp
+    if config.option.basetemp or not sys.platform.startswith("linux"):
+        return
+    if not (os.path.isdir(_SHM_DIR) and os.access(_SHM_DIR, os.W_OK)):
+        return
+    # 每次运行使用独立的目录，避免同时运行的多个测试会话互相删除文件
+    _shm_basetemp = tempfile.mkdtemp(prefix="pytest-", dir=_SHM_DIR)
+    config.option.basetemp = _shm_basetemp
+
+
+def pytest_unconfigure(config) -> None:
+    # tmpfs 占用的是内存，测试结束后立即释放
+    if _shm_basetemp is not None:
+        shutil.rmtree(_shm_basetemp, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def golden_dir(tmp_path_factory) -> Callable[[str, Callable[[Path], None]], Path]:
+    """按名称缓存只读的测试图片目录，整个测试会话中每组图片只编码一次
+
+    测试用例不能直接修改返回的目录，应先用 copy_golden 复制到自己的 tmp_path 中。
+
+    Returns:
+        get(name, build): 首次调用时创建目录并调用 build(目录) 生成图片，之后直接返回该目录
+    """
+    cache: dict[str, Path] = {}
+
+    def get(name: str, build: Callable[[Path], None]) -> Path:
+        if name not in cache:
+            path = tmp_path_factory.mktemp(f"golden_{name}")
+            build(path)
+            cache[name] = path
+        return cache[name]
+
+    return get
+
+
+@pytest.fixture
+def copy_golden(request) -> Callable[[Path, Path], Path]:
+    """把 golden_dir 返回的测试图片目录复制到测试自己的目录中
+
+    标记了 readonly_images 的测试不会修改样例图片，此时以硬链接代替复制，
+    不需要复制文件内容；其他测试得到独立的副本，可以随意修改。
+
+    Returns:
+        copy(src, dst): 把 src 目录复制为 dst 并返回 dst
+    """
+    readonly = request.node.get_closest_marker("readonly_images") is not None
+    copy_function = os.link if readonly else shutil.copy2
+
+    def copy(src: Path, dst: Path) -> Path:
+        return Path(shutil.copytree(src, dst, copy_function=copy_function))
+
+    return copy
+
+
+@pytest.fixture(scope="session")
+def rmtree_later() -> Callable[[Path], None]:
+    """在后台线程中删除测试目录，清理时不阻塞下一个测试的准备工作
+
+    Returns:
+        remove(path): 启动后台线程删除 path，目录不存在时忽略
+    """
+
+    def remove(path: Path) -> None:
+        thread = threading.Thread(
+            target=shutil.rmtree, args=(path,), kwargs={"ignore_errors": True}
+        )
+        thread.daemon = True
+        thread.start()
+        _removal_threads.append(thread)
+
+    return remove
+
+
+@functools.lru_cache(maxsize=1024)
+def _cached_image_size(path: str, mtime_ns: int, size: int) -> tuple[int, int]:
+    # 只解析文件头 (PNG/JPEG/WebP 等的尺寸都在文件开头)，不创建解码器
+    return get_image_size(Path(path))
+
+
+@pytest.fixture(scope="session")
+def image_size() -> Callable[[Path], tuple[int, int]]:
+    """读取图片尺寸，结果按 (路径, 修改时间, 文件大小) 缓存
+
+    图片被处理后修改时间和文件大小会变化，因此处理后再次读取会得到新的尺寸。
+
+    Returns:
+        get(path): 返回图片的 (宽, 高)
+    """
+
+    def get(path: Path) -> tuple[int, int]:
+        stat = os.stat(path)
+        return _cached_image_size(str(path), stat.st_mtime_ns, stat.st_size)
+
+    return get
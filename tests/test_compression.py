@@ -1,4 +1,5 @@
 import shutil
+from pathlib import Path
 
 import pytest
 from PIL import Image
@@ -7,43 +8,49 @@ from src.core.enums import CompressionMode
 from src.processor.compression import Compression
 
 
+def _create_sample_images(test_dir: Path) -> None:
+    """在目录中创建测试图片"""
+    # 创建一个子目录用于测试递归功能
+    sub_dir = test_dir / "sub_dir"
+    sub_dir.mkdir()
+
+    # 创建测试图片的辅助函数
+    def create_test_image(path, size=(200, 200), mode="RGB", color="red"):
+        img = Image.new(mode, size, color=color)
+        img.save(path)
+
+    # 在主目录创建测试图片
+    create_test_image(test_dir / "test1.jpg")
+    create_test_image(test_dir / "test2.png", mode="RGBA", color=(255, 0, 0, 128))
+    create_test_image(test_dir / "test3.webp")
+
+    # 在子目录创建一个图片
+    create_test_image(sub_dir / "sub_test.jpg", color="blue")
+
+
+@pytest.mark.xdist_group("compression")
 class TestCompression:
     @pytest.fixture
-    def sample_images(self, tmp_path):
-        """创建测试图片供测试使用"""
+    def sample_images(self, tmp_path, golden_dir, copy_golden, rmtree_later):
+        """复制一份测试图片供测试使用"""
+        # 测试图片整个会话只生成一次，每个测试复制一份，互不影响
         test_dir = tmp_path / "test_images"
-        test_dir.mkdir()
-
-        # 创建一个子目录用于测试递归功能
+        copy_golden(golden_dir("compression", _create_sample_images), test_dir)
         sub_dir = test_dir / "sub_dir"
-        sub_dir.mkdir()
-
-        # 创建测试图片的辅助函数
-        def create_test_image(path, size=(200, 200), mode="RGB", color="red"):
-            img = Image.new(mode, size, color=color)
-            img.save(path)
-            return path
-
-        # 在主目录创建测试图片
-        jpeg_path = create_test_image(test_dir / "test1.jpg")
-        png_path = create_test_image(
-            test_dir / "test2.png", mode="RGBA", color=(255, 0, 0, 128)
-        )
-        webp_path = create_test_image(test_dir / "test3.webp")
-
-        # 在子目录创建一个图片
-        sub_img_path = create_test_image(sub_dir / "sub_test.jpg", color="blue")
 
         yield {
             "dir": test_dir,
-            "images": [jpeg_path, png_path, webp_path],
+            "images": [
+                test_dir / "test1.jpg",
+                test_dir / "test2.png",
+                test_dir / "test3.webp",
+            ],
             "sub_dir": sub_dir,
-            "sub_img": sub_img_path,
+            "sub_img": sub_dir / "sub_test.jpg",
         }
 
         # 清理测试数据
-        if test_dir.exists():
-            shutil.rmtree(test_dir)
+        rmtree_later(test_dir)
 
     # process方法的测试用例
 
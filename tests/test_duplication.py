@@ -1,18 +1,18 @@
-import shutil
 from pathlib import Path
 
 import pytest
+from imagededup.methods import AHash, PHash
 from PIL import Image, ImageDraw
 
 from src.processor.duplication import Duplication, DuplicationMode, SaveFileMode
 
+# 使用 pytest-xdist 并行运行时，本模块的测试分配到同一个进程
+pytestmark = pytest.mark.xdist_group("duplication")
+
 
 # 测试数据准备工具
-@pytest.fixture
-def sample_dir(tmp_path):
-    """创建临时测试目录和测试图片文件"""
-    test_dir = tmp_path / "test_images"
-    test_dir.mkdir()
+def _create_sample_images(test_dir: Path) -> None:
+    """在目录中创建测试图片"""
 
     # 创建测试图片
     def create_dummy_image(path: Path, size=(100, 100), color="red"):
@@ -24,7 +24,8 @@ def sample_dir(tmp_path):
             )
         else:
             draw.rectangle((60, 60, 80, 80), fill="yellow")
-        img.save(path, "PNG")
+        # 样例图片只在测试中读取，不需要压缩，省去 zlib 编码的时间
+        img.save(path, "PNG", compress_level=0)
 
     # 创建一组测试图片
     create_dummy_image(test_dir / "image1.png", color="red")
@@ -40,11 +41,18 @@ def sample_dir(tmp_path):
     create_dummy_image(test_dir / "alpha_first.png", color="cyan")
     create_dummy_image(test_dir / "zeta_last.png", color="cyan")  # alpha_first的重复项
 
+
+@pytest.fixture
+def sample_dir(tmp_path, golden_dir, copy_golden, rmtree_later):
+    """复制一份测试图片到临时测试目录"""
+    # 测试图片整个会话只生成一次，每个测试复制一份，互不影响
+    test_dir = tmp_path / "test_images"
+    copy_golden(golden_dir("duplication", _create_sample_images), test_dir)
+
     yield test_dir
 
     # 清理临时文件
-    if test_dir.exists():
-        shutil.rmtree(test_dir)
+    rmtree_later(test_dir)
 
 
 # 测试用例
@@ -69,6 +77,32 @@ def test_no_override_save_first(sample_dir):
     assert len(list(output_path.iterdir())) < 8
 
 
+@pytest.mark.parametrize("hardlink", [False, True])
+def test_no_override_output_independent_of_original(sample_dir, hardlink):
+    """测试非覆盖模式下原地修改输出图片不会影响原图 (除非显式开启硬链接)"""
+    original_bytes = {p.name: p.read_bytes() for p in sample_dir.iterdir()}
+
+    output_path = Duplication().process(
+        img_dir=sample_dir,
+        duplication_mode=DuplicationMode.Fastest,
+        override=False,
+        hardlink=hardlink,
+    )
+    kept = min(output_path.iterdir())
+    original = sample_dir / kept.name
+    assert kept.samefile(original) is hardlink
+
+    # 与各个覆盖模式的工具一样，原地重新保存输出目录中的图片
+    with Image.open(kept) as img:
+        img.load()
+    img.rotate(90).save(kept)
+
+    if hardlink:
+        assert original.read_bytes() != original_bytes[kept.name]
+    else:
+        assert original.read_bytes() == original_bytes[kept.name]
+
+
 def test_override_save_bigger(sample_dir):
     """测试覆盖模式 + SaveBigger策略"""
     deduplicator = Duplication()
@@ -163,3 +197,17 @@ def test_process_dir(sample_dir):
 
     # 验证输出目录中的文件数量减少（去除了重复）
     assert len(list(output_path.iterdir())) < 8
+
+
+@pytest.mark.parametrize(
+    "duplication_mode, hasher_cls",
+    [(DuplicationMode.Fastest, AHash), (DuplicationMode.Best, PHash)],
+)
+def test_fast_encoding_matches_imagededup(sample_dir, duplication_mode, hasher_cls):
+    """测试 NumPy 批量编码结果与 imagededup 完全一致"""
+    expected = hasher_cls(verbose=False).encode_images(image_dir=str(sample_dir))
+
+    deduplicator = Duplication()
+    encodings = deduplicator._encode_images_fast(sample_dir, duplication_mode)
+
+    assert encodings == expected
@@ -1,48 +1,55 @@
-import shutil
+from pathlib import Path
 
+import loguru
 import pytest
 from PIL import Image
 
 from src.processor.format_conversion import FormatConversion
 
 
+def _create_sample_images(test_dir: Path) -> None:
+    """在目录中创建测试图片"""
+    # 创建一个子目录用于测试递归功能
+    sub_dir = test_dir / "sub_dir"
+    sub_dir.mkdir()
+
+    # 创建测试图片的辅助函数
+    def create_test_image(path, size=(200, 200), mode="RGB", color="red"):
+        img = Image.new(mode, size, color=color)
+        img.save(path)
+
+    # 在主目录创建测试图片
+    create_test_image(test_dir / "test1.jpg")
+    create_test_image(test_dir / "transparent.png", mode="RGBA", color=(255, 0, 0, 128))
+    create_test_image(test_dir / "test3.webp")
+
+    # 在子目录创建一个图片
+    create_test_image(sub_dir / "sub_test.jpg", color="blue")
+
+
+@pytest.mark.xdist_group("format_conversion")
 class TestFormatConversion:
     @pytest.fixture
-    def sample_images(self, tmp_path):
-        """创建测试图片供测试使用"""
+    def sample_images(self, tmp_path, golden_dir, copy_golden, rmtree_later):
+        """复制一份测试图片供测试使用"""
+        # 测试图片整个会话只生成一次，每个测试复制一份，互不影响
         test_dir = tmp_path / "test_images"
-        test_dir.mkdir()
-
-        # 创建一个子目录用于测试递归功能
+        copy_golden(golden_dir("format_conversion", _create_sample_images), test_dir)
         sub_dir = test_dir / "sub_dir"
-        sub_dir.mkdir()
-
-        # 创建测试图片的辅助函数
-        def create_test_image(path, size=(200, 200), mode="RGB", color="red"):
-            img = Image.new(mode, size, color=color)
-            img.save(path)
-            return path
-
-        # 在主目录创建测试图片
-        jpg_path = create_test_image(test_dir / "test1.jpg")
-        png_path = create_test_image(
-            test_dir / "transparent.png", mode="RGBA", color=(255, 0, 0, 128)
-        )
-        webp_path = create_test_image(test_dir / "test3.webp")
-
-        # 在子目录创建一个图片
-        sub_img_path = create_test_image(sub_dir / "sub_test.jpg", color="blue")
 
         yield {
             "dir": test_dir,
-            "images": [jpg_path, png_path, webp_path],
+            "images": [
+                test_dir / "test1.jpg",
+                test_dir / "transparent.png",
+                test_dir / "test3.webp",
+            ],
             "sub_dir": sub_dir,
-            "sub_img": sub_img_path,
+            "sub_img": sub_dir / "sub_test.jpg",
         }
 
         # 清理测试数据
-        if test_dir.exists():
-            shutil.rmtree(test_dir)
+        rmtree_later(test_dir)
 
     # process方法的测试用例
 
@@ -84,6 +91,21 @@ class TestFormatConversion:
             assert img.format == "JPEG"
             assert img.mode == "RGB"  # 应该变成RGB模式，没有透明通道
 
+    def test_process_transparent_png_to_bmp_white_background(self, sample_images):
+        """测试透明像素被混合到白色背景上"""
+        converter = FormatConversion()
+        png_path = sample_images["images"][1]
+
+        output_path = converter.process(png_path, target_format="bmp", override=False)
+
+        # 半透明红色 (255, 0, 0, 128) 混合白色背景后应为浅红色
+        with Image.open(output_path) as img:
+            assert img.mode == "RGB"
+            r, g, b = img.getpixel((0, 0))
+            assert r == 255
+            assert abs(g - 127) <= 1
+            assert abs(b - 127) <= 1
+
     def test_process_without_override(self, sample_images):
         """测试不覆盖原图的情况"""
         converter = FormatConversion()
@@ -101,6 +123,26 @@ class TestFormatConversion:
         assert webp_path.exists()
         assert output_path.exists()
 
+    def test_compile_reuse_for_multiple_images(self, sample_images):
+        """测试预编译的转换函数可以复用于多张图片"""
+        converter = FormatConversion()
+        convert = converter.compile("webp")
+
+        output_paths = [
+            convert(img_path, False) for img_path in sample_images["images"]
+        ]
+
+        for output_path in output_paths:
+            assert output_path.suffix == ".webp"
+            assert "_out" in output_path.name
+            with Image.open(output_path) as img:
+                assert img.format == "WEBP"
+
+    def test_compile_unsupported_format(self):
+        """测试预编译不支持的格式时抛出异常"""
+        with pytest.raises(ValueError):
+            FormatConversion().compile("gif")
+
     # process_dir方法的测试用例
 
     def test_process_dir_basic(self, sample_images):
@@ -148,6 +190,29 @@ class TestFormatConversion:
         with Image.open(converted_sub_img) as img:
             assert img.format == "WEBP"
 
+    def test_process_dir_skips_colliding_outputs(self, tmp_path):
+        """测试多张图片转换到同一个输出文件时只转换其中一张并记录警告"""
+        Image.new("RGB", (50, 50), "red").save(tmp_path / "a.jpg")
+        Image.new("RGB", (50, 50), "blue").save(tmp_path / "a.png")
+        Image.new("RGB", (50, 50), "green").save(tmp_path / "b.jpg")
+        Image.new("RGB", (50, 50), "blue").save(tmp_path / "b.webp")
+        messages = []
+        handler_id = loguru.logger.add(messages.append, level="WARNING")
+        try:
+            FormatConversion().process_dir(tmp_path, target_format="webp")
+        finally:
+            loguru.logger.remove(handler_id)
+
+        # a.jpg 排在前面，a.png 被跳过
+        with Image.open(tmp_path / "a.webp") as img:
+            red, _, blue = img.convert("RGB").getpixel((25, 25))
+            assert red > blue
+        # 已经是目标格式的 b.webp 不会被 b.jpg 覆盖
+        with Image.open(tmp_path / "b.webp") as img:
+            red, green, blue = img.convert("RGB").getpixel((25, 25))
+            assert blue > green
+        assert len(messages) == 2
+
     def test_process_dir_without_override(self, sample_images):
         """测试不覆盖原文件的目录处理"""
         converter = FormatConversion()
@@ -178,3 +243,24 @@ class TestFormatConversion:
         for bmp_path in bmp_files:
             with Image.open(bmp_path) as img:
                 assert img.format == "BMP"
+
+    def test_process_dir_without_override_keeps_layout(self, sample_images):
+        """测试不覆盖时输出目录保持原有的子目录结构"""
+        converter = FormatConversion()
+        test_dir = sample_images["dir"]
+        sub_img_path = sample_images["sub_img"]
+        assert sub_img_path == test_dir / "sub_dir" / "sub_test.jpg"
+
+        output_dir = converter.process_dir(
+            test_dir, target_format="png", override=False
+        )
+
+        # 子目录中的图片应输出到 <输出目录>/sub_dir/ 下，而不是输出目录根部
+        converted_sub_img = output_dir / "sub_dir" / "sub_test.png"
+        assert converted_sub_img.exists()
+        assert not (output_dir / "sub_test.png").exists()
+        with Image.open(converted_sub_img) as img:
+            assert img.format == "PNG"
+
+        # 原图保持不变
+        assert sub_img_path.exists()
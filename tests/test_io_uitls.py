@@ -0,0 +1,281 @@
+import multiprocessing
+import os
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+from src.core import constants
+from src.utils.io_uitls import IOuitls
+
+# 使用 pytest-xdist 并行运行时，本模块的测试分配到同一个进程
+pytestmark = pytest.mark.xdist_group("io_uitls")
+
+
+def _stem(path: Path) -> str:
+    # imap_paths 在子进程中调用，必须是模块级函数
+    return path.stem
+
+
+def _parent_pid(path: Path) -> int:
+    return os.getppid()
+
+
+class TestLinkOrCopy:
+    @pytest.fixture
+    def src(self, tmp_path) -> Path:
+        path = tmp_path / "src.bin"
+        path.write_bytes(b"source")
+        return path
+
+    def test_copy_is_independent(self, src, tmp_path):
+        """测试默认不使用硬链接，修改目标文件不会影响源文件"""
+        dst = tmp_path / "dst.bin"
+        IOuitls.link_or_copy(src, dst)
+
+        assert dst.read_bytes() == b"source"
+        assert not dst.samefile(src)
+        assert src.stat().st_nlink == 1
+        assert dst.stat().st_mtime_ns == src.stat().st_mtime_ns
+
+        dst.write_bytes(b"changed")
+        assert src.read_bytes() == b"source"
+
+    def test_hardlink_opt_in(self, src, tmp_path):
+        """测试显式开启 hardlink 时使用硬链接"""
+        dst = tmp_path / "dst.bin"
+        IOuitls.link_or_copy(src, dst, hardlink=True)
+
+        assert dst.read_bytes() == b"source"
+        assert dst.samefile(src)
+
+    @pytest.mark.parametrize("hardlink", [False, True])
+    def test_existing_destination_is_kept(self, src, tmp_path, hardlink):
+        """测试目标文件已存在时抛出 FileExistsError，且不会删除已有的目标文件"""
+        dst = tmp_path / "dst.bin"
+        dst.write_bytes(b"existing")
+
+        with pytest.raises(FileExistsError):
+            IOuitls.link_or_copy(src, dst, hardlink=hardlink)
+        assert dst.read_bytes() == b"existing"
+
+    def test_missing_source_leaves_no_destination(self, tmp_path):
+        """测试源文件不存在时不会留下目标文件"""
+        dst = tmp_path / "dst.bin"
+        with pytest.raises(FileNotFoundError):
+            IOuitls.link_or_copy(tmp_path / "missing.bin", dst)
+        assert not os.path.lexists(dst)
+
+
+class TestGetImgPathsByDir:
+    def test_paths_are_sorted(self, tmp_path):
+        """测试返回的路径按顺序排列，不受文件系统返回目录项的顺序影响"""
+        for i in range(20):
+            sub_dir = tmp_path / f"dir{i:02d}"
+            sub_dir.mkdir()
+            (sub_dir / "b.png").touch()
+            (sub_dir / "a.jpg").touch()
+        (tmp_path / "z.png").touch()
+
+        paths = IOuitls.get_img_paths_by_dir(tmp_path)
+        assert len(paths) == 41
+        assert paths == sorted(paths)
+
+    def test_default_exclude_dirs(self, tmp_path):
+        """测试默认跳过 constants.DEFAULT_EXCLUDE_DIRS 中的目录"""
+        (tmp_path / "a.png").touch()
+        for name in (".git", "__pycache__", "node_modules"):
+            assert name in constants.DEFAULT_EXCLUDE_DIRS
+            (tmp_path / name).mkdir()
+            (tmp_path / name / "hidden.png").touch()
+
+        assert IOuitls.get_img_paths_by_dir(tmp_path) == [tmp_path / "a.png"]
+
+    def test_custom_exclude_dirs(self, tmp_path):
+        """测试自定义的 exclude_dirs 替换默认值"""
+        (tmp_path / "skip").mkdir()
+        (tmp_path / "skip" / "a.png").touch()
+        (tmp_path / ".git").mkdir()
+        (tmp_path / ".git" / "b.png").touch()
+
+        paths = IOuitls.get_img_paths_by_dir(tmp_path, exclude_dirs=frozenset({"skip"}))
+        assert paths == [tmp_path / ".git" / "b.png"]
+
+    def test_non_recursive(self, tmp_path):
+        """测试不递归时只返回根目录中的图片"""
+        (tmp_path / "a.png").touch()
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / "b.png").touch()
+
+        paths = IOuitls.get_img_paths_by_dir(tmp_path, recursion=False)
+        assert paths == [tmp_path / "a.png"]
+
+    def test_default_suffixes_ignore_case(self, tmp_path):
+        """测试默认后缀名匹配不区分大小写，且不返回非图片文件"""
+        for name in ("a.JPG", "b.Png", "c.webp", "d.txt", ".png"):
+            (tmp_path / name).touch()
+
+        names = [p.name for p in IOuitls.get_img_paths_by_dir(tmp_path)]
+        # 整个文件名就是后缀的文件 (".png") 与 Path.suffix 一致，不算图片
+        assert names == ["a.JPG", "b.Png", "c.webp"]
+
+    @pytest.mark.parametrize("suffix", [(".JPG",), ("jpg",), (".jpg",), ("JPG",)])
+    def test_custom_suffix_normalized(self, tmp_path, suffix):
+        """测试自定义后缀名可以是大写或不带点的形式"""
+        for name in ("a.jpg", "b.JPG", "c.png"):
+            (tmp_path / name).touch()
+
+        names = [p.name for p in IOuitls.get_img_paths_by_dir(tmp_path, suffix=suffix)]
+        assert names == ["a.jpg", "b.JPG"]
+
+    def test_symlinks(self, tmp_path):
+        """测试指向图片的符号链接会被返回，指向目录的符号链接不会被进入"""
+        target_dir = tmp_path / "target"
+        target_dir.mkdir()
+        (target_dir / "real.png").touch()
+        root = tmp_path / "root"
+        root.mkdir()
+        try:
+            (root / "link.png").symlink_to(target_dir / "real.png")
+            (root / "broken.png").symlink_to(tmp_path / "missing.png")
+            (root / "linked_dir").symlink_to(target_dir, target_is_directory=True)
+        except OSError:
+            pytest.skip("当前平台不允许创建符号链接")
+
+        assert IOuitls.get_img_paths_by_dir(root) == [root / "link.png"]
+
+    def test_unreadable_sub_dir_is_skipped(self, tmp_path, monkeypatch):
+        """测试无法读取的子目录被跳过，其他目录中的图片照常返回"""
+        (tmp_path / "a.png").touch()
+        readable = tmp_path / "readable"
+        readable.mkdir()
+        (readable / "b.png").touch()
+        locked = tmp_path / "System Volume Information"
+        locked.mkdir()
+        (locked / "c.png").touch()
+
+        # 以 root 运行时 chmod 无法阻止读取，这里直接让 scandir 抛出权限错误
+        real_scandir = os.scandir
+
+        def scandir(path):
+            if os.fspath(path) == os.fspath(locked):
+                raise PermissionError(13, "Permission denied", os.fspath(path))
+            return real_scandir(path)
+
+        monkeypatch.setattr(os, "scandir", scandir)
+
+        paths = IOuitls.get_img_paths_by_dir(tmp_path)
+        assert paths == [tmp_path / "a.png", readable / "b.png"]
+
+    def test_unreadable_root_returns_nothing(self, tmp_path, monkeypatch):
+        """测试根目录本身无法读取时返回空列表"""
+        (tmp_path / "a.png").touch()
+
+        def scandir(path):
+            raise PermissionError(13, "Permission denied", os.fspath(path))
+
+        monkeypatch.setattr(os, "scandir", scandir)
+
+        assert IOuitls.get_img_paths_by_dir(tmp_path) == []
+        assert IOuitls.get_img_paths_by_dir(tmp_path, recursion=False) == []
+
+
+class TestImapPaths:
+    def test_all_results_returned(self, tmp_path):
+        """测试 imap_paths 返回每个路径的结果，且每个只返回一次"""
+        paths = [tmp_path / f"{i}.png" for i in range(50)]
+
+        results = list(IOuitls.imap_paths(_stem, paths, workers=2))
+        assert sorted(results, key=int) == [str(i) for i in range(50)]
+
+    def test_generator_input(self, tmp_path):
+        """测试 paths 为没有长度的生成器时同样可以处理"""
+        paths = (tmp_path / f"{i}.png" for i in range(5))
+
+        assert sorted(IOuitls.imap_paths(_stem, paths, workers=2)) == list("01234")
+
+    @pytest.mark.skipif(
+        "forkserver" not in multiprocessing.get_all_start_methods(),
+        reason="forkserver is not available on this platform",
+    )
+    def test_workers_not_forked_from_caller(self, tmp_path):
+        """测试工作进程不是从调用方 (可能已有其他线程) 直接 fork 出来的"""
+        paths = [tmp_path / f"{i}.png" for i in range(4)]
+
+        parents = set(IOuitls.imap_paths(_parent_pid, paths, workers=2))
+        assert os.getpid() not in parents
+
+
+class TestDetectNewFiles:
+    def test_new_files_detected(self, tmp_path):
+        """测试第一次迭代返回 None，第二次返回新增文件的绝对路径"""
+        (tmp_path / "old.png").touch()
+        (tmp_path / "sub").mkdir()
+
+        detector = IOuitls.detect_new_files(tmp_path)
+        assert next(detector) is None
+
+        (tmp_path / "new.png").touch()
+        (tmp_path / "sub" / "nested.png").touch()
+        new_files = next(detector)
+
+        # 只检测目录直属的文件，不包括子目录
+        assert new_files == [tmp_path.absolute() / "new.png"]
+        assert all(p.is_absolute() for p in new_files)
+
+    def test_invalid_directory(self, tmp_path):
+        """测试路径不是目录时抛出 ValueError"""
+        with pytest.raises(ValueError):
+            next(IOuitls.detect_new_files(tmp_path / "missing"))
+
+
+class TestWatchNewFiles:
+    @pytest.fixture
+    def no_watchfiles(self, monkeypatch):
+        # sys.modules 中的 None 会让 import watchfiles 抛出 ImportError
+        monkeypatch.setitem(sys.modules, "watchfiles", None)
+
+    @pytest.mark.parametrize("mode", ["poll", "auto"])
+    def test_poll_detects_new_files(self, tmp_path, no_watchfiles, mode):
+        """测试轮询模式 (以及未安装 watchfiles 时的 auto 模式) 返回新增文件"""
+        (tmp_path / "old.png").touch()
+        (tmp_path / "sub").mkdir()
+        watcher = IOuitls.watch_new_files(tmp_path, mode=mode, poll_interval=0.2)
+
+        # 第一次快照在调用 next() 时记录，之后才创建新文件
+        timer = threading.Timer(0.05, (tmp_path / "new.png").touch)
+        timer.start()
+        try:
+            assert next(watcher) == [tmp_path.absolute() / "new.png"]
+        finally:
+            timer.join()
+            watcher.close()
+
+    def test_notify_requires_watchfiles(self, tmp_path, no_watchfiles):
+        """测试明确要求 notify 模式但没有安装 watchfiles 时抛出 ImportError"""
+        with pytest.raises(ImportError):
+            next(IOuitls.watch_new_files(tmp_path, mode="notify"))
+
+    def test_invalid_directory(self, tmp_path):
+        """测试路径不是目录时抛出 ValueError"""
+        with pytest.raises(ValueError):
+            next(IOuitls.watch_new_files(tmp_path / "missing", mode="poll"))
+
+
+class TestCopyWithTimes:
+    def test_content_and_times_copied(self, tmp_path):
+        """测试复制内容并保留访问/修改时间"""
+        src = tmp_path / "src.bin"
+        src.write_bytes(b"data")
+        os.utime(src, ns=(1_000_000_000, 2_000_000_000))
+        dst = tmp_path / "dst.bin"
+
+        IOuitls.copy_with_times(src, dst)
+
+        # 先检查时间，读取文件内容会更新访问时间
+        st = dst.stat()
+        assert st.st_mtime_ns == 2_000_000_000
+        assert st.st_atime_ns == 1_000_000_000
+        assert dst.read_bytes() == b"data"
+        assert not dst.samefile(src)
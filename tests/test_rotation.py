@@ -1,6 +1,9 @@
+import os
 import shutil
+import sys
 from pathlib import Path
 
+import loguru
 import pytest
 from PIL import Image, ImageDraw
 
@@ -8,50 +11,85 @@ from src.core.enums import Orientation, RotationMode
 from src.processor.rotation import Rotation
 
 
+def _create_sample_images(test_dir: Path) -> None:
+    """在目录中创建测试图片"""
+    # 只绘制一次模板图片，各个尺寸的测试图片都从模板左上角裁剪得到，
+    # 裁剪结果与逐张绘制的图片逐像素相同
+    template = Image.new("RGB", (100, 100), color="red")
+    draw = ImageDraw.Draw(template)
+    draw.rectangle((10, 10, 30, 30), fill="blue")  # 添加标记以区分旋转效果
+
+    def create_test_image(path: Path, size=(100, 80)):
+        # 创建非正方形图片以便于测试方向
+        # 样例图片只在测试中读取，不需要压缩，省去 zlib 编码的时间
+        template.crop((0, 0, *size)).save(path, "PNG", compress_level=0)
+
+    # 创建水平图片(宽>高)
+    create_test_image(test_dir / "horizontal.png", size=(100, 80))
+    # 创建垂直图片(高>宽)
+    create_test_image(test_dir / "vertical.png", size=(80, 100))
+    # 创建正方形图片(宽=高)
+    create_test_image(test_dir / "square.png", size=(90, 90))
+
+    # 创建一些子目录测试图片，用于测试递归功能
+    sub_dir = test_dir / "subdir"
+    sub_dir.mkdir()
+    create_test_image(sub_dir / "sub_horizontal.png", size=(100, 80))
+    create_test_image(sub_dir / "sub_vertical.png", size=(80, 100))
+
+
+_real_process_wrapper = Rotation._process_wrapper
+
+
+def _fail_some_batches(tasks, **kwargs):
+    """模拟工作进程出错：horizontal.png 所在批次抛出异常，vertical.png 返回错误消息"""
+    names = {img_path.name for img_path, _ in tasks}
+    if "horizontal.png" in names:
+        raise RuntimeError("模拟的批次错误")
+    if "vertical.png" in names:
+        return ["Error processing vertical.png: 模拟的图片错误"]
+    return _real_process_wrapper(tasks, **kwargs)
+
+
+def _snapshot(dir_path: Path, recursive: bool = True) -> list[Path]:
+    """用一次 os.scandir 遍历列出目录中的 PNG 图片，代替多次 glob"""
+    files = []
+    pending = [dir_path]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if recursive:
+                        pending.append(Path(entry.path))
+                elif entry.name.endswith(".png"):
+                    files.append(Path(entry.path))
+    return files
+
+
+@pytest.mark.xdist_group("rotation")
 class TestRotation:
     @pytest.fixture
-    def sample_dir(self, tmp_path):
-        """创建临时测试目录和测试图片文件"""
+    def sample_dir(self, tmp_path, golden_dir, copy_golden, rmtree_later):
+        """复制一份测试图片到临时测试目录"""
+        # 测试图片整个会话只生成一次，每个测试复制一份，互不影响
         test_dir = tmp_path / "test_rotation"
-        test_dir.mkdir()
-
-        # 创建测试图片
-        def create_test_image(path: Path, size=(100, 80), color="red"):
-            # 创建非正方形图片以便于测试方向
-            img = Image.new("RGB", size, color=color)
-            draw = ImageDraw.Draw(img)
-            draw.rectangle((10, 10, 30, 30), fill="blue")  # 添加标记以区分旋转效果
-            img.save(path, "PNG")
-
-        # 创建水平图片(宽>高)
-        create_test_image(test_dir / "horizontal.png", size=(100, 80))
-        # 创建垂直图片(高>宽)
-        create_test_image(test_dir / "vertical.png", size=(80, 100))
-        # 创建正方形图片(宽=高)
-        create_test_image(test_dir / "square.png", size=(90, 90))
-
-        # 创建一些子目录测试图片，用于测试递归功能
-        sub_dir = test_dir / "subdir"
-        sub_dir.mkdir()
-        create_test_image(sub_dir / "sub_horizontal.png", size=(100, 80))
-        create_test_image(sub_dir / "sub_vertical.png", size=(80, 100))
+        copy_golden(golden_dir("rotation", _create_sample_images), test_dir)
 
         yield test_dir
 
         # 清理临时文件
-        if test_dir.exists():
-            shutil.rmtree(test_dir)
+        rmtree_later(test_dir)
 
     # process方法的测试用例
-    def test_process_horizontal_to_vertical(self, sample_dir):
+    @pytest.mark.readonly_images
+    def test_process_horizontal_to_vertical(self, sample_dir, image_size):
         """测试将水平图片旋转为垂直方向"""
         rotator = Rotation()
         img_path = sample_dir / "horizontal.png"
 
         # 获取原始尺寸
-        with Image.open(img_path) as img:
-            original_width, original_height = img.size
-            assert original_width > original_height  # 确认初始是水平的
+        original_width, original_height = image_size(img_path)
+        assert original_width > original_height  # 确认初始是水平的
 
         # 执行旋转
         output_path = rotator.process(
@@ -73,15 +111,14 @@ class TestRotation:
             assert new_width == original_height
             assert new_height == original_width
 
-    def test_process_vertical_no_rotation_needed(self, sample_dir):
+    def test_process_vertical_no_rotation_needed(self, sample_dir, image_size):
         """测试垂直图片已经符合要求，不需要旋转"""
         rotator = Rotation()
         img_path = sample_dir / "vertical.png"
 
         # 获取原始尺寸
-        with Image.open(img_path) as img:
-            original_width, original_height = img.size
-            assert original_height > original_width  # 确认初始是垂直的
+        original_width, original_height = image_size(img_path)
+        assert original_height > original_width  # 确认初始是垂直的
 
         # 执行操作(目标也是垂直)
         output_path = rotator.process(
@@ -92,20 +129,19 @@ class TestRotation:
         assert output_path == img_path
 
         # 验证图片尺寸没有变化
-        with Image.open(output_path) as img:
-            new_width, new_height = img.size
-            assert new_width == original_width
-            assert new_height == original_height
+        new_width, new_height = image_size(output_path)
+        assert new_width == original_width
+        assert new_height == original_height
 
-    def test_process_square_image(self, sample_dir):
+    @pytest.mark.readonly_images
+    def test_process_square_image(self, sample_dir, image_size):
         """测试正方形图片处理(不应该被旋转，因为不是严格的水平或垂直)"""
         rotator = Rotation()
         img_path = sample_dir / "square.png"
 
         # 获取原始尺寸
-        with Image.open(img_path) as img:
-            original_width, original_height = img.size
-            assert original_width == original_height  # 确认是正方形
+        original_width, original_height = image_size(img_path)
+        assert original_width == original_height  # 确认是正方形
 
         # 执行旋转(尝试转为水平方向)
         output_path = rotator.process(
@@ -117,18 +153,47 @@ class TestRotation:
         assert output_path.name == "square_out.png"
 
         # 验证图片尺寸没有变化(正方形应该保持不变)
+        new_width, new_height = image_size(output_path)
+        assert new_width == original_width
+        assert new_height == original_height
+
+    @pytest.mark.skipif(shutil.which("jpegtran") is None, reason="未安装 jpegtran")
+    def test_process_jpeg_lossless_rotation(self, sample_dir):
+        """测试JPEG图片通过jpegtran无损旋转(覆盖原图)"""
+        rotator = Rotation()
+        img_path = sample_dir / "horizontal.jpg"
+        # 尺寸为MCU(16x16)的整数倍，保证可以完美旋转
+        Image.new("RGB", (128, 64), color="red").save(img_path, "JPEG")
+
+        output_path = rotator.process(
+            img_path=img_path,
+            orientation=Orientation.Vertical,
+            rotation_mode=RotationMode.Clockwise,
+            override=True,
+        )
+
+        assert output_path == img_path
         with Image.open(output_path) as img:
-            new_width, new_height = img.size
-            assert new_width == original_width
-            assert new_height == original_height
+            assert img.format == "JPEG"
+            assert img.size == (64, 128)
+        # 临时文件应已被替换掉
+        assert not (sample_dir / ".horizontal.jpg.tmp").exists()
+
+    @pytest.mark.parametrize("fmt", ["PNG", "JPEG", "GIF", "BMP", "WEBP"])
+    def test_get_image_dimensions_from_header(self, tmp_path, fmt):
+        """测试通过文件头解析得到的尺寸与 Pillow 一致"""
+        img_path = tmp_path / f"size.{fmt.lower()}"
+        Image.new("RGB", (123, 45), color="red").save(img_path, fmt)
+
+        assert Rotation()._get_image_dimensions(img_path) == (123, 45)
 
     # process_dir方法的测试用例
-    def test_process_dir_with_override(self, sample_dir):
+    def test_process_dir_with_override(self, sample_dir, image_size):
         """测试处理目录下所有图片(覆盖模式)"""
         rotator = Rotation()
 
         # 获取处理前文件数量
-        file_count_before = len(list(sample_dir.glob("*.png")))
+        file_count_before = len(_snapshot(sample_dir, recursive=False))
         assert file_count_before > 0
 
         # 执行目录处理
@@ -143,22 +208,20 @@ class TestRotation:
         assert output_dir == sample_dir
 
         # 验证处理前后文件数量相同(应该是覆盖而非创建新文件)
-        file_count_after = len(list(sample_dir.glob("*.png")))
-        assert file_count_after == file_count_before
+        files_after = _snapshot(sample_dir, recursive=False)
+        assert len(files_after) == file_count_before
 
-        # 验证所有原水平图片现在都是垂直的
-        for img_path in sample_dir.glob("*.png"):
-            with Image.open(img_path) as img:
-                width, height = img.size
-                if img_path.name != "square.png":  # 排除正方形图片
-                    assert height >= width  # 所有非正方形图片都应该是垂直的或正方形
+        # 验证所有原水平图片现在都是垂直的(正方形图片宽高相等，同样满足)
+        sizes = {p.name: image_size(p) for p in files_after}
+        assert all(height >= width for width, height in sizes.values()), sizes
 
-    def test_process_dir_without_override(self, sample_dir):
+    @pytest.mark.readonly_images
+    def test_process_dir_without_override(self, sample_dir, image_size):
         """测试处理目录下所有图片(非覆盖模式)"""
         rotator = Rotation()
 
         # 记录处理前的原始文件路径
-        original_files = list(sample_dir.glob("*.png"))
+        original_files = _snapshot(sample_dir, recursive=False)
 
         # 执行目录处理
         output_dir = rotator.process_dir(
@@ -178,19 +241,77 @@ class TestRotation:
             assert file.exists()
 
         # 验证输出目录中所有图片都是水平的或正方形
-        for img_path in output_dir.glob("*.png"):
-            with Image.open(img_path) as img:
-                width, height = img.size
-                if width != height:  # 排除正方形图片
-                    assert width >= height  # 所有非正方形图片都应该是水平的
+        sizes = {p.name: image_size(p) for p in _snapshot(output_dir, recursive=False)}
+        assert all(width >= height for width, height in sizes.values()), sizes
+
+    @pytest.mark.parametrize("hardlink", [True, False])
+    def test_process_dir_without_override_unrotated_files(self, sample_dir, hardlink):
+        """测试非覆盖模式下无需旋转的图片被原样放入输出目录"""
+        rotator = Rotation()
 
-    def test_process_dir_with_recursion(self, sample_dir):
+        output_dir = rotator.process_dir(
+            img_dir_path=sample_dir,
+            orientation=Orientation.Vertical,
+            override=False,
+            recursion=False,
+            hardlink=hardlink,
+        )
+
+        # 垂直图片无需旋转，内容应与原图完全一致
+        source = sample_dir / "vertical.png"
+        target = output_dir / "vertical.png"
+        assert target.read_bytes() == source.read_bytes()
+
+        if hardlink:
+            # 开启硬链接时输出与原图是同一个文件
+            assert target.samefile(source)
+        else:
+            # 默认应得到独立的副本
+            assert not target.samefile(source)
+            assert source.stat().st_nlink == 1
+
+    def test_process_dir_without_override_copies_by_default(self, sample_dir):
+        """测试默认情况下无需旋转的图片以独立副本的形式放入输出目录"""
+        output_dir = Rotation().process_dir(
+            img_dir_path=sample_dir,
+            orientation=Orientation.Vertical,
+            override=False,
+            recursion=False,
+        )
+
+        assert not (output_dir / "vertical.png").samefile(sample_dir / "vertical.png")
+
+    @pytest.mark.skipif(sys.platform == "win32", reason="需要 fork 继承替换后的函数")
+    def test_process_dir_reports_every_failed_batch(self, sample_dir, monkeypatch):
+        """测试某一批图片处理失败时，其余批次的结果和错误仍然被处理和记录"""
+        monkeypatch.setattr(
+            Rotation, "_process_wrapper", staticmethod(_fail_some_batches)
+        )
+        messages = []
+        handler_id = loguru.logger.add(messages.append, level="ERROR")
+        try:
+            # 单进程时每张图片各为一批
+            output_dir = Rotation().process_dir(
+                img_dir_path=sample_dir,
+                orientation=Orientation.Vertical,
+                override=False,
+                recursion=False,
+                thread_num=1,
+            )
+        finally:
+            loguru.logger.remove(handler_id)
+
+        assert any("horizontal.png" in message for message in messages)
+        assert any("vertical.png" in message for message in messages)
+        assert (output_dir / "square.png").exists()
+
+    @pytest.mark.readonly_images
+    def test_process_dir_with_recursion(self, sample_dir, image_size):
         """测试递归处理子目录中的图片"""
         rotator = Rotation()
 
         # 获取处理前所有图片(包括子目录)
-        list(sample_dir.glob("**/*.png"))
-        sub_files_before = list((sample_dir / "subdir").glob("*.png"))
+        sub_files_before = _snapshot(sample_dir / "subdir")
         assert len(sub_files_before) > 0  # 确保子目录有文件
 
         # 执行递归目录处理
@@ -210,12 +331,10 @@ class TestRotation:
         assert sub_output_dir.exists()
 
         # 验证处理后的子目录中的文件数量与原来相同
-        sub_files_after = list(sub_output_dir.glob("*.png"))
+        output_files = _snapshot(output_dir)
+        sub_files_after = [p for p in output_files if p.parent == sub_output_dir]
         assert len(sub_files_after) == len(sub_files_before)
 
         # 验证所有处理后的图片(包括子目录中的)都是垂直的或正方形
-        for img_path in output_dir.glob("**/*.png"):
-            with Image.open(img_path) as img:
-                width, height = img.size
-                if width != height:  # 排除正方形图片
-                    assert height >= width  # 所有非正方形图片都应该是垂直的
+        sizes = {str(p.relative_to(output_dir)): image_size(p) for p in output_files}
+        assert all(height >= width for width, height in sizes.values()), sizes
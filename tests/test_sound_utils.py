@@ -0,0 +1,29 @@
+import time
+
+from src.utils import sound_utils
+from src.utils.sound_utils import SoundUtils
+
+
+class TestSoundUtils:
+    def test_wait_for_beeps_blocks_until_played(self, monkeypatch):
+        """测试 wait_for_beeps 会等到排队中的提示音播放完成"""
+        played = []
+
+        class FakeWinsound:
+            @staticmethod
+            def Beep(frequency, duration):
+                time.sleep(0.05)
+                played.append((frequency, duration))
+
+        monkeypatch.setattr(sound_utils, "winsound", FakeWinsound)
+
+        SoundUtils.beep()
+        SoundUtils.wait_for_beeps()
+        assert len(played) == 1
+
+    def test_beep_without_winsound(self, monkeypatch):
+        """测试非 Windows 平台上 beep 和 wait_for_beeps 直接返回"""
+        monkeypatch.setattr(sound_utils, "winsound", None)
+
+        SoundUtils.beep()
+        SoundUtils.wait_for_beeps()
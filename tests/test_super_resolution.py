@@ -1,58 +1,69 @@
-import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import pytest
 from PIL import Image
+from tqdm import tqdm
 
 from src.core.enums import SuperResolutionModel
 from src.processor.super_resolution import SuperResolution
 
 
-class TestSuperResolution:
-    @pytest.fixture
-    def sample_images(self, tmp_path):
-        """创建测试图片供测试使用"""
-        test_dir = tmp_path / "test_images"
-        test_dir.mkdir()
+def _create_sample_images(test_dir: Path) -> None:
+    """在目录中创建测试图片"""
+    # 创建一个子目录用于测试递归功能
+    sub_dir = test_dir / "sub_dir"
+    sub_dir.mkdir()
 
-        # 创建一个子目录用于测试递归功能
-        sub_dir = test_dir / "sub_dir"
-        sub_dir.mkdir()
+    # 创建测试图片的辅助函数
+    def create_test_image(path, size=(100, 100), color="red"):
+        img = Image.new("RGB", size, color=color)
+        img.save(path)
 
-        # 创建测试图片的辅助函数
-        def create_test_image(path, size=(100, 100), color="red"):
-            img = Image.new("RGB", size, color=color)
-            img.save(path)
-            return path
+    # 在主目录创建测试图片
+    create_test_image(test_dir / "test1.jpg")
+    create_test_image(test_dir / "test2.png")
+    create_test_image(test_dir / "test3.webp")
 
-        # 在主目录创建测试图片
-        jpeg_path = create_test_image(test_dir / "test1.jpg")
-        png_path = create_test_image(test_dir / "test2.png")
-        webp_path = create_test_image(test_dir / "test3.webp")
+    # 在子目录创建一个图片
+    create_test_image(sub_dir / "sub_test.jpg", color="blue")
 
-        # 在子目录创建一个图片
-        sub_img_path = create_test_image(sub_dir / "sub_test.jpg", color="blue")
+
+@pytest.mark.xdist_group("super_resolution")
+class TestSuperResolution:
+    @pytest.fixture
+    def sample_images(self, tmp_path, golden_dir, copy_golden, rmtree_later):
+        """复制一份测试图片供测试使用"""
+        # 测试图片整个会话只生成一次，每个测试复制一份，互不影响
+        test_dir = tmp_path / "test_images"
+        copy_golden(golden_dir("super_resolution", _create_sample_images), test_dir)
+        sub_dir = test_dir / "sub_dir"
 
         yield {
             "dir": test_dir,
-            "images": [jpeg_path, png_path, webp_path],
+            "images": [
+                test_dir / "test1.jpg",
+                test_dir / "test2.png",
+                test_dir / "test3.webp",
+            ],
             "sub_dir": sub_dir,
-            "sub_img": sub_img_path,
+            "sub_img": sub_dir / "sub_test.jpg",
         }
 
         # 清理测试数据
-        if test_dir.exists():
-            shutil.rmtree(test_dir)
+        rmtree_later(test_dir)
 
     # process方法的测试用例
 
-    def test_process_basic_upscaling(self, sample_images):
+    def test_process_basic_upscaling(self, sample_images, image_size):
         """测试基本的超分辨率功能"""
         processor = SuperResolution()
         jpeg_path = sample_images["images"][0]
 
         # 获取原始图像尺寸
-        with Image.open(jpeg_path) as img:
-            original_width, original_height = img.size
+        original_width, original_height = image_size(jpeg_path)
 
         # 执行处理
         output_path = processor.process(jpeg_path, scale=2)
@@ -61,59 +72,115 @@ class TestSuperResolution:
         assert output_path == jpeg_path
 
         # 验证图像尺寸已放大
-        with Image.open(output_path) as img:
-            assert img.width == original_width * 2
-            assert img.height == original_height * 2
+        assert image_size(output_path) == (original_width * 2, original_height * 2)
 
-    def test_process_with_different_models(self, sample_images):
+    def test_process_with_different_models(self, sample_images, image_size):
         """测试不同超分模型的处理效果"""
         processor = SuperResolution()
 
         # 测试Cunet模型，使用JPEG图片
         jpeg_path = sample_images["images"][0]
-        with Image.open(jpeg_path) as img:
-            jpeg_width, jpeg_height = img.size
+        jpeg_width, jpeg_height = image_size(jpeg_path)
 
         output_path = processor.process(
             jpeg_path, model=SuperResolutionModel.Cunet, scale=2
         )
-        with Image.open(output_path) as img:
-            # Cunet模型可能会有不同的输出尺寸
-            assert img.width == jpeg_width * 2
-            assert img.height == jpeg_height * 2
+        # Cunet模型可能会有不同的输出尺寸
+        assert image_size(output_path) == (jpeg_width * 2, jpeg_height * 2)
 
         # 测试UpconvAnime模型，使用PNG图片
         png_path = sample_images["images"][1]
-        with Image.open(png_path) as img:
-            png_width, png_height = img.size
+        png_width, png_height = image_size(png_path)
 
         output_path = processor.process(
             png_path, model=SuperResolutionModel.UpconvAnime, scale=2
         )
-        with Image.open(output_path) as img:
-            assert img.width == png_width * 2
-            assert img.height == png_height * 2
+        assert image_size(output_path) == (png_width * 2, png_height * 2)
 
         # 测试UpconvPhoto模型，使用WEBP图片
         webp_path = sample_images["images"][2]
-        with Image.open(webp_path) as img:
-            webp_width, webp_height = img.size
+        webp_width, webp_height = image_size(webp_path)
 
         output_path = processor.process(
             webp_path, model=SuperResolutionModel.UpconvPhoto, scale=2
         )
-        with Image.open(output_path) as img:
-            assert img.width == webp_width * 2
-            assert img.height == webp_height * 2
+        assert image_size(output_path) == (webp_width * 2, webp_height * 2)
+
+    def test_waifu2x_instance_reused(self):
+        """测试相同参数复用同一个 Waifu2x 实例，清除缓存后重新创建"""
+        processor = SuperResolution()
+        model = SuperResolutionModel.UpconvAnime
+
+        first = processor._create_waifu2x(0, 2, model)
+        assert processor._create_waifu2x(0, 2, model) is first
+        assert processor._create_waifu2x(1, 2, model) is not first
+
+        SuperResolution.clear_cache()
+        assert processor._create_waifu2x(0, 2, model) is not first
+
+    def test_shared_waifu2x_serializes_inference(self, monkeypatch):
+        """测试多个线程共用同一个 Waifu2x 实例时推理调用不会并发执行"""
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        class FakeWaifu2x:
+            def __init__(self, **kwargs):
+                pass
+
+            def process_pil(self, image):
+                with lock:
+                    active.append(None)
+                    peak.append(len(active))
+                time.sleep(0.01)
+                with lock:
+                    active.pop()
+                return image
+
+        monkeypatch.setattr("src.processor.super_resolution.Waifu2x", FakeWaifu2x)
+        SuperResolution.clear_cache()
+        processor = SuperResolution()
+        waifu2x = processor._create_waifu2x(0, 2, SuperResolutionModel.UpconvAnime)
+        image = Image.new("RGB", (8, 8))
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(lambda _: waifu2x.process_pil(image), range(8)))
+
+        assert max(peak) == 1
+        SuperResolution.clear_cache()
+
+    def test_gpu_lookup_cached(self, monkeypatch):
+        """测试只在第一次创建实例时查询可用的 GPU"""
+        calls = []
+
+        def get_first_available():
+            calls.append(None)
+            return [0]
+
+        monkeypatch.setattr(
+            "src.processor.super_resolution.GPUtil.getFirstAvailable",
+            get_first_available,
+        )
+        SuperResolution.clear_cache()
+        processor = SuperResolution()
+
+        processor._create_waifu2x(0, 2, SuperResolutionModel.UpconvAnime)
+        processor._create_waifu2x(1, 2, SuperResolutionModel.Cunet)
+        assert len(calls) == 1
 
-    def test_process_without_override(self, sample_images):
+        SuperResolution.clear_cache()
+        processor._create_waifu2x(0, 2, SuperResolutionModel.UpconvAnime)
+        assert len(calls) == 2
+        SuperResolution.clear_cache()
+
+    @pytest.mark.readonly_images
+    def test_process_without_override(self, sample_images, image_size):
         """测试不覆盖原图的情况"""
         processor = SuperResolution()
         webp_path = sample_images["images"][2]
 
         # 获取原始图像尺寸
-        with Image.open(webp_path) as img:
-            original_width, original_height = img.size
+        original_width, original_height = image_size(webp_path)
 
         # 处理但不覆盖原图
         output_path = processor.process(webp_path, override=False, scale=2)
@@ -127,13 +194,84 @@ class TestSuperResolution:
         assert output_path.exists()
 
         # 验证图像尺寸已放大
-        with Image.open(output_path) as img:
-            assert img.width == original_width * 2
-            assert img.height == original_height * 2
+        assert image_size(output_path) == (original_width * 2, original_height * 2)
+
+    @pytest.mark.readonly_images
+    def test_process_batch(self, sample_images, image_size):
+        """测试批量处理多张图片并保存到指定路径"""
+        processor = SuperResolution()
+        img_paths = sample_images["images"]
+        output_paths = [
+            img_path.with_name(f"batch_{img_path.name}") for img_path in img_paths
+        ]
+
+        results = processor.process_batch(
+            img_paths, scale=2, override=False, output_paths=output_paths
+        )
+
+        assert sorted(results) == sorted(output_paths)
+        for img_path, output_path in zip(img_paths, output_paths):
+            width, height = image_size(img_path)
+            assert image_size(output_path) == (width * 2, height * 2)
+
+    def test_pipeline_stage_failure_raised(self, sample_images):
+        """测试流水线某一阶段出错时停止并重新抛出错误，而不是一直等待"""
+        processor = SuperResolution()
+        tasks = [(img_path, None) for img_path in sample_images["images"]] * 4
+
+        class FailingProgress:
+            def update(self, n):
+                raise RuntimeError("progress failed")
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(
+                processor._run_pipeline,
+                tasks,
+                lambda image: image,
+                False,
+                2,
+                FailingProgress(),
+            )
+            with pytest.raises(RuntimeError, match="progress failed"):
+                future.result(timeout=30)
+
+    def test_pipeline_bounds_images_in_flight(self, sample_images, tmp_path):
+        """测试同时存在的图片数量不随任务数增长"""
+        processor = SuperResolution()
+        img_path = sample_images["images"][0]
+        tasks = [(img_path, tmp_path / f"out_{i}.jpg") for i in range(20)]
+        alive = []
+        peak = []
+        lock = threading.Lock()
+        load_image = processor._load_image
+        save_image = processor._save_image
+
+        def counting_load(path):
+            with lock:
+                alive.append(None)
+                peak.append(len(alive))
+            return load_image(path)
+
+        def counting_save(*args):
+            output = save_image(*args)
+            with lock:
+                alive.pop()
+            return output
+
+        processor._load_image = counting_load
+        processor._save_image = counting_save
+
+        with tqdm(total=len(tasks), disable=True) as progress:
+            results = processor._run_pipeline(
+                tasks, lambda image: image, False, 4, progress
+            )
+
+        assert sorted(results) == sorted(output for _, output in tasks)
+        assert max(peak) <= 4
 
     # process_dir方法的测试用例
 
-    def test_process_dir_basic(self, sample_images):
+    def test_process_dir_basic(self, sample_images, image_size):
         """测试基本的目录处理功能"""
         processor = SuperResolution()
         test_dir = sample_images["dir"]
@@ -141,8 +279,7 @@ class TestSuperResolution:
         # 获取处理前所有图片的尺寸
         original_sizes = {}
         for img_path in sample_images["images"] + [sample_images["sub_img"]]:
-            with Image.open(img_path) as img:
-                original_sizes[str(img_path)] = img.size
+            original_sizes[str(img_path)] = image_size(img_path)
 
         # 处理目录
         output_dir = processor.process_dir(test_dir, scale=2)
@@ -152,12 +289,10 @@ class TestSuperResolution:
 
         # 验证所有图片都被处理并放大
         for img_path in sample_images["images"] + [sample_images["sub_img"]]:
-            with Image.open(img_path) as img:
-                orig_width, orig_height = original_sizes[str(img_path)]
-                assert img.width == orig_width * 2
-                assert img.height == orig_height * 2
+            orig_width, orig_height = original_sizes[str(img_path)]
+            assert image_size(img_path) == (orig_width * 2, orig_height * 2)
 
-    def test_process_dir_recursion(self, sample_images):
+    def test_process_dir_recursion(self, sample_images, image_size):
         """测试递归处理与非递归处理"""
         processor = SuperResolution()
         test_dir = sample_images["dir"]
@@ -165,35 +300,31 @@ class TestSuperResolution:
         # 获取主目录和子目录图片的原始尺寸
         main_img_sizes = {}
         for img_path in sample_images["images"]:
-            with Image.open(img_path) as img:
-                main_img_sizes[str(img_path)] = img.size
+            main_img_sizes[str(img_path)] = image_size(img_path)
 
-        with Image.open(sample_images["sub_img"]) as img:
-            sub_img_original_size = img.size
+        sub_img_original_size = image_size(sample_images["sub_img"])
 
         # 非递归处理
         processor.process_dir(test_dir, recursion=False, scale=2)
 
         # 验证主目录的图片已处理
         for img_path in sample_images["images"]:
-            with Image.open(img_path) as img:
-                orig_width, orig_height = main_img_sizes[str(img_path)]
-                assert img.width == orig_width * 2
-                assert img.height == orig_height * 2
+            orig_width, orig_height = main_img_sizes[str(img_path)]
+            assert image_size(img_path) == (orig_width * 2, orig_height * 2)
 
         # 验证子目录的图片未处理
-        with Image.open(sample_images["sub_img"]) as img:
-            assert img.size == sub_img_original_size
+        assert image_size(sample_images["sub_img"]) == sub_img_original_size
 
         # 递归处理
         processor.process_dir(test_dir, recursion=True, scale=2)
 
         # 验证子目录的图片也被处理了
-        with Image.open(sample_images["sub_img"]) as img:
-            assert img.width == sub_img_original_size[0] * 2
-            assert img.height == sub_img_original_size[1] * 2
+        assert image_size(sample_images["sub_img"]) == (
+            sub_img_original_size[0] * 2,
+            sub_img_original_size[1] * 2,
+        )
 
-    def test_process_dir_with_suffix_filter(self, sample_images):
+    def test_process_dir_with_suffix_filter(self, sample_images, image_size):
         """测试使用特定后缀过滤图片"""
         processor = SuperResolution()
         test_dir = sample_images["dir"]
@@ -201,24 +332,21 @@ class TestSuperResolution:
         # 获取所有图片的原始尺寸
         original_sizes = {}
         for img_path in sample_images["images"] + [sample_images["sub_img"]]:
-            with Image.open(img_path) as img:
-                original_sizes[str(img_path)] = img.size
+            original_sizes[str(img_path)] = image_size(img_path)
 
         # 仅处理JPEG图片
         processor.process_dir(test_dir, suffix=(".jpg",), scale=2)
 
         # 验证只有jpg图片被处理
         for img_path in sample_images["images"] + [sample_images["sub_img"]]:
-            with Image.open(img_path) as img:
-                orig_width, orig_height = original_sizes[str(img_path)]
-                if img_path.suffix.lower() == ".jpg":
-                    assert img.width == orig_width * 2
-                    assert img.height == orig_height * 2
-                else:
-                    assert img.width == orig_width
-                    assert img.height == orig_height
-
-    def test_process_dir_without_override(self, sample_images):
+            orig_width, orig_height = original_sizes[str(img_path)]
+            if img_path.suffix.lower() == ".jpg":
+                assert image_size(img_path) == (orig_width * 2, orig_height * 2)
+            else:
+                assert image_size(img_path) == (orig_width, orig_height)
+
+    @pytest.mark.readonly_images
+    def test_process_dir_without_override(self, sample_images, image_size):
         """测试不覆盖原目录的情况"""
         processor = SuperResolution()
         test_dir = sample_images["dir"]
@@ -226,25 +354,11 @@ class TestSuperResolution:
         # 获取原始图片尺寸
         original_sizes = {}
         for img_path in sample_images["images"]:
-            with Image.open(img_path) as img:
-                original_sizes[img_path.name] = img.size
+            original_sizes[img_path.name] = image_size(img_path)
 
         # 处理目录，不覆盖原目录
         output_dir = processor.process_dir(test_dir, override=False, scale=3)
 
-        # 创建新目录(实际上process_dir应该创建，这里只是为了让测试通过)
-        if not output_dir.exists():
-            output_dir.mkdir(parents=True, exist_ok=True)
-
-            # 复制原始图片到新目录并放大它们(模拟超分辨率处理)
-            for img_path in sample_images["images"]:
-                with Image.open(img_path) as img:
-                    orig_width, orig_height = img.size
-                    # 创建放大版本
-                    resized_img = img.resize((orig_width * 3, orig_height * 3))
-                    # 保存到新目录
-                    resized_img.save(output_dir / img_path.name)
-
         # 验证返回的是新目录
         assert output_dir != test_dir
         assert output_dir.name == f"{test_dir.name}_sr3x"
@@ -252,15 +366,11 @@ class TestSuperResolution:
 
         # 验证原始图片保持不变
         for img_path in sample_images["images"]:
-            with Image.open(img_path) as img:
-                orig_size = original_sizes[img_path.name]
-                assert img.size == orig_size
+            assert image_size(img_path) == original_sizes[img_path.name]
 
         # 验证新目录中的图片已被放大
         for img_path in sample_images["images"]:
             new_img_path = output_dir / img_path.name
-            if new_img_path.exists():  # 确保文件被创建
-                with Image.open(new_img_path) as img:
-                    orig_width, orig_height = original_sizes[img_path.name]
-                    assert img.width == orig_width * 3
-                    assert img.height == orig_height * 3
+            assert new_img_path.exists()
+            orig_width, orig_height = original_sizes[img_path.name]
+            assert image_size(new_img_path) == (orig_width * 3, orig_height * 3)